@@ -0,0 +1,171 @@
+"""Контроль допуска для тяжёлых эндпоинтов: лимиты параллельности, очереди, сброс нагрузки.
+
+У каждого эндпоинта свой лимит одновременных запросов, а все эндпоинты,
+которые ходят в LLM, дополнительно делят общий лимит llm — столько, сколько
+Ollama переваривает без роста задержки. Ожидающие запросы стоят в очереди
+по приоритету (interactive раньше batch); очередь ограничена по длине и по
+времени ожидания. Если места нет, запрос сразу получает 503 с Retry-After,
+а не висит минутами.
+
+Лимиты действуют в пределах одного процесса (воркера uvicorn).
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_SHED, ADMISSION_WAIT_SECONDS
+
+
+# --- Настройки (через переменные окружения) ---
+LLM_CONCURRENCY = int(os.getenv("ADMISSION_LLM_CONCURRENCY", "2"))
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+# Лимиты эндпоинтов по умолчанию; переопределяются ADMISSION_<ИМЯ>_CONCURRENCY
+ENDPOINT_CONCURRENCY = {
+    "process_text": 4,
+    "compliance": 2,
+    "process": 2,
+    "ocr": os.cpu_count() or 2,
+}
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class Overloaded(Exception):
+    def __init__(self, limiter: str, reason: str, retry_after: int):
+        super().__init__(f"{limiter}: {reason}")
+        self.limiter = limiter
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionLimiter:
+    """Семафор с ограниченной очередью по приоритетам.
+
+    Освободившийся слот передаётся первому ожидающему из очереди (меньший
+    приоритет — раньше, при равных — кто раньше пришёл), поэтому новые
+    запросы не обгоняют стоящих в очереди.
+    """
+
+    def __init__(self, name: str, concurrency: int, max_queue: int = MAX_QUEUE):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.active = 0
+        self._queue = []  # (приоритет, номер, future)
+        self._seq = itertools.count()
+        self.hold_seconds = 1.0  # скользящее среднее времени занятия слота — для Retry-After
+
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._queue if not future.done())
+
+    def retry_after(self) -> int:
+        # Сколько примерно займёт разбор уже стоящей очереди
+        seconds = self.hold_seconds * (self.waiting() + 1) / self.concurrency
+        return max(1, min(300, math.ceil(seconds)))
+
+    def _shed(self, reason: str):
+        ADMISSION_SHED.labels(self.name, reason).inc()
+        raise Overloaded(self.name, reason, self.retry_after())
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE.labels(self.name).set(self.active)
+        ADMISSION_QUEUE_DEPTH.labels(self.name).set(self.waiting())
+
+    async def acquire(self, priority: int, deadline: float):
+        if self.active < self.concurrency and not self.waiting():
+            self.active += 1
+            self._update_gauges()
+            return
+        if self.waiting() >= self.max_queue:
+            self._shed("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), future))
+        self._update_gauges()
+        try:
+            # Если слот успели передать в момент таймаута, wait_for вернёт результат, а не ошибку
+            await asyncio.wait_for(future, timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._update_gauges()
+            self._shed("timeout")
+        except asyncio.CancelledError:
+            # Клиент ушёл; если слот уже был передан нам — отдаём его следующему
+            if future.done() and not future.cancelled():
+                self.release()
+            self._update_gauges()
+            raise
+
+    def release(self, held_seconds: Optional[float] = None):
+        if held_seconds is not None:
+            self.hold_seconds = 0.8 * self.hold_seconds + 0.2 * held_seconds
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                # Слот переходит ожидающему, active не меняется
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+
+llm_limiter = AdmissionLimiter("llm", LLM_CONCURRENCY)
+_limiters = {}
+
+
+def endpoint_limiter(name: str) -> AdmissionLimiter:
+    if name not in _limiters:
+        concurrency = int(os.getenv(f"ADMISSION_{name.upper()}_CONCURRENCY", str(ENDPOINT_CONCURRENCY.get(name, 4))))
+        _limiters[name] = AdmissionLimiter(name, concurrency)
+    return _limiters[name]
+
+
+def request_priority(default: str):
+    """Зависимость FastAPI: класс приоритета запроса — из заголовка X-Priority, иначе default эндпоинта."""
+
+    def dependency(x_priority: Optional[str] = Header(None)) -> str:
+        priority = (x_priority or default).lower()
+        return priority if priority in PRIORITIES else default
+
+    return dependency
+
+
+@asynccontextmanager
+async def admitted(endpoint: Optional[str], priority: str = "batch", llm: bool = False):
+    """Держит слот эндпоинта (и общий слот llm) на время работы; при перегрузке — HTTPException 503.
+
+    endpoint=None — только слот llm: его берут вокруг самого обращения к LLM внутри
+    уже допущенного запроса, чтобы OCR и классификация не держали общий лимит.
+    """
+    limiters = ([endpoint_limiter(endpoint)] if endpoint else []) + ([llm_limiter] if llm else [])
+    deadline = time.monotonic() + MAX_WAIT
+    started = time.monotonic()
+    held = []
+    try:
+        for limiter in limiters:
+            await limiter.acquire(PRIORITIES[priority], deadline)
+            held.append(limiter)
+    except BaseException as e:
+        for limiter in reversed(held):
+            limiter.release()
+        if isinstance(e, Overloaded):
+            raise HTTPException(
+                503, f"Сервис перегружен ({e.limiter}: {e.reason}), повторите позже",
+                headers={"Retry-After": str(e.retry_after)},
+            ) from e
+        raise
+    ADMISSION_WAIT_SECONDS.labels(endpoint or "llm", priority).observe(time.monotonic() - started)
+    admitted_at = time.monotonic()
+    try:
+        yield
+    finally:
+        for limiter in reversed(held):
+            limiter.release(time.monotonic() - admitted_at)
@@ -0,0 +1,157 @@
+"""Нагрузочный бенчмарк обхода ЕГРЮЛ через локальную заглушку ФНС (fns_stub).
+
+Поднимает заглушку в этом же процессе, направляет на неё egrul.py и
+прогоняет get_owners по набору корневых ИНН с заданной параллельностью.
+
+    python bench_egrul.py --roots 20 --concurrency 5 --depth 3 --fanout 3
+    python bench_egrul.py --latency-ms 200 --stub-rate-limit 30   # медленная ФНС с троттлингом
+    python bench_egrul.py --cache                                 # с кэшем выписок
+
+Печатает выписок/с, p50/p99 времени обхода одного корня, время разбора PDF
+и соотношение ожидания и работы из fns_governor.
+"""
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import threading
+import time
+
+import uvicorn
+
+import egrul
+import fns_governor
+import fns_stub
+from egrul_cache import extract_cache
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(fns_stub.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+class ParseTimer:
+    """Обёртка над parse_owners, суммирующая время разбора PDF."""
+
+    def __init__(self, parse):
+        self.parse = parse
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def __call__(self, pdf, level=0):
+        started = time.perf_counter()
+        try:
+            return self.parse(pdf, level)
+        finally:
+            with self._lock:
+                self.samples.append(time.perf_counter() - started)
+
+
+async def run(args):
+    roots = [fns_stub._derive_inn("root", args.seed, k) for k in range(args.roots)]
+    latencies = []
+    fetched = 0
+    partial = 0
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(root):
+        nonlocal fetched, partial
+        async with limit:
+            started = time.perf_counter()
+            report = await egrul.get_owners_report(root)
+            latencies.append(time.perf_counter() - started)
+            fetched += report["stats"]["fetched"]
+            partial += report["partial"]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(root) for root in roots))
+    return time.perf_counter() - started, latencies, fetched, partial
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--roots", type=int, default=10, help="сколько корневых компаний обойти")
+    parser.add_argument("--concurrency", type=int, default=4, help="одновременных обходов")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--persons", type=int, default=2)
+    parser.add_argument("--shared", type=float, default=0.3, help="доля общих участников между цепочками")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--poll-waits", type=int, default=2)
+    parser.add_argument("--stub-rate-limit", type=float, default=0, help="лимит заглушки, запросов/с (429 сверх)")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate", type=float, default=1000, help="лимит fns_governor, запросов/с")
+    parser.add_argument("--cache", action="store_true", help="не отключать кэш выписок")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="вывести результат одной JSON-строкой")
+    args = parser.parse_args()
+
+    fns_stub.configure(
+        depth=args.depth, fanout=args.fanout, persons=args.persons, shared=args.shared,
+        latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4, poll_waits=args.poll_waits,
+        rate_limit=args.stub_rate_limit, error_rate=args.error_rate, seed=args.seed,
+    )
+    port = free_port()
+    server = start_stub(port)
+
+    egrul.BASE_URL = f"http://127.0.0.1:{port}"
+    fns_governor.governor.bucket = fns_governor.TokenBucket(args.rate, max(1, int(args.rate)))
+    fns_governor.stats.reset()
+    if not args.cache:
+        extract_cache.ttl = 0
+    timer = ParseTimer(egrul.parse_owners)
+    egrul.parse_owners = timer
+
+    wall, latencies, fetched, partial = asyncio.run(run(args))
+    server.should_exit = True
+
+    governor = fns_governor.stats.snapshot()
+    result = {
+        "roots": args.roots,
+        "wall_sec": round(wall, 3),
+        "fetches": fetched,
+        "fetches_per_sec": round(fetched / wall, 2) if wall else 0,
+        "root_latency_p50_sec": round(percentile(latencies, 50), 3),
+        "root_latency_p99_sec": round(percentile(latencies, 99), 3),
+        "partial_roots": partial,
+        "parse_count": len(timer.samples),
+        "parse_total_sec": round(sum(timer.samples), 3),
+        "parse_mean_ms": round(statistics.mean(timer.samples) * 1000, 2) if timer.samples else 0,
+        "governor": governor,
+        "stub": json.loads(fns_stub.stub_stats().body),
+    }
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    print(f"Корней: {result['roots']}, время: {result['wall_sec']} с, выписок: {result['fetches']}"
+          f" ({result['fetches_per_sec']} в секунду)")
+    print(f"Обход одного корня: p50 {result['root_latency_p50_sec']} с, p99 {result['root_latency_p99_sec']} с,"
+          f" неполных: {result['partial_roots']}")
+    print(f"Разбор PDF: {result['parse_count']} шт., всего {result['parse_total_sec']} с,"
+          f" в среднем {result['parse_mean_ms']} мс")
+    print(f"fns_governor: работа {governor['work_seconds']} с, ожидание {governor['wait_seconds']} с"
+          f" (лимит {governor['rate_limit_wait_seconds']}, ретраи {governor['retry_wait_seconds']},"
+          f" поллинг {governor['poll_wait_seconds']}), ретраев {governor['retries']}, 429: {governor['throttled']}")
+    print(f"Заглушка: {result['stub']}")
+
+
+if __name__ == "__main__":
+    main()
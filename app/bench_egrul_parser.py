@@ -0,0 +1,131 @@
+"""Бенчмарк разбора выписок ЕГРЮЛ: прежний построчный поиск против однопроходного индекса.
+
+    python bench_egrul_parser.py                      # синтетические выписки групп
+    python bench_egrul_parser.py extracts/*.pdf       # реальные выписки
+    python bench_egrul_parser.py --sizes 10,100,500 --repeat 5
+
+Для каждой выписки печатает время разбора старым и новым способом
+и проверяет, что оба нашли одних и тех же владельцев.
+"""
+import argparse
+import random
+import re
+import statistics
+import time
+
+import fitz  # pymupdf
+
+from egrul_fixtures import make_group_extract
+from egrul_parser import is_participant, parse_lines, pdf_to_lines
+
+
+# --- Прежний парсер (до однопроходного индекса), оставлен для сравнения ---
+def legacy_find_inn_above_or_below(lines, index, lookahead=30):
+    for j in range(index, min(index + lookahead, len(lines))):
+        match_inline = re.search(r'ИНН.*?(\d{10,12})', lines[j])
+        if match_inline:
+            return match_inline.group(1)
+        if lines[j].strip().upper() == "ИНН" and j + 1 < len(lines):
+            match = re.search(r'\d{10,12}', lines[j + 1])
+            if match:
+                return match.group()
+    for j in range(index - 1, max(index - lookahead, -1), -1):
+        match_inline = re.search(r'ИНН.*?(\d{10,12})', lines[j])
+        if match_inline:
+            return match_inline.group(1)
+        if lines[j].strip().upper() == "ИНН" and j + 1 < len(lines):
+            match = re.search(r'\d{10,12}', lines[j + 1])
+            if match:
+                return match.group()
+    return None
+
+
+def legacy_find_share_nearby(lines, start_index):
+    for j in range(start_index, min(start_index + 30, len(lines))):
+        if "Номинальная стоимость доли" in lines[j]:
+            if j + 1 < len(lines):
+                match = re.search(r'\d+', lines[j + 1])
+                if match:
+                    return match.group()
+    return None
+
+
+def legacy_pdf_to_lines(pdf_bytes):
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    return [line.strip() for page in doc for line in page.get_text().splitlines()]
+
+
+def legacy_parse_lines(lines):
+    persons, companies = [], []
+    i = 0
+    while i < len(lines):
+        if lines[i].upper() == "ФАМИЛИЯ" and i + 5 < len(lines):
+            fio = f"{lines[i+1]} {lines[i+3]} {lines[i+5]}"
+            persons.append({"ФИО": fio, "ИНН": None, "Доля (руб)": legacy_find_share_nearby(lines, i)})
+            i += 6
+            continue
+        if re.search(r'\b(ООО|АО|ПАО)\b', lines[i]):
+            companies.append({"Наименование": lines[i], "ИНН": legacy_find_inn_above_or_below(lines, i)})
+        i += 1
+    return persons, companies
+
+
+def timed(func, arg, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(arg)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, result
+
+
+def same_owners(legacy, new):
+    # Раздела у прежнего парсера нет, а долю он ищет и за границей раздела, поэтому
+    # сравниваются ФИО, наименования и ИНН, а доли — только у участников
+    fio = lambda persons: [p["ФИО"] for p in persons]
+    strip = lambda companies: [(c["Наименование"], c["ИНН"]) for c in companies]
+    shares_match = all(
+        old["Доля (руб)"] == person["Доля (руб)"]
+        for old, person in zip(legacy[0], new[0]) if is_participant(person)
+    )
+    return fio(legacy[0]) == fio(new[0]) and shares_match and strip(legacy[1]) == strip(new[1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="*", help="файлы выписок; без них генерируются синтетические")
+    parser.add_argument("--sizes", default="5,50,200,500", help="число участников в синтетических выписках")
+    parser.add_argument("--foreign", type=float, default=0.5, help="доля участников-юрлиц без ИНН (худший случай для поиска)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.pdfs:
+        samples = []
+        for path in args.pdfs:
+            with open(path, "rb") as f:
+                samples.append((path, f.read()))
+    else:
+        rng = random.Random(42)
+        samples = [
+            (f"synthetic-{n}", make_group_extract(rng, n // 2, n - n // 2, args.foreign))
+            for n in (int(x) for x in args.sizes.split(","))
+        ]
+
+    print("Время в мс (медиана): извлечение строк из PDF / разбор строк / итого")
+    print(f"{'выписка':<20}{'строк':>7}{'старый':>24}{'новый':>24}{'ускорение':>11}  совпадает")
+    for name, pdf in samples:
+        legacy_extract, legacy_lines = timed(legacy_pdf_to_lines, pdf, args.repeat)
+        legacy_parse, legacy = timed(legacy_parse_lines, legacy_lines, args.repeat)
+        new_extract, new_lines = timed(pdf_to_lines, pdf, args.repeat)
+        new_parse, new = timed(parse_lines, new_lines, args.repeat)
+        legacy_total = legacy_extract + legacy_parse
+        new_total = new_extract + new_parse
+        print(
+            f"{name:<20}{len(new_lines):>7}"
+            f"{legacy_extract:>10.1f} /{legacy_parse:>5.1f} /{legacy_total:>6.1f}"
+            f"{new_extract:>10.1f} /{new_parse:>5.1f} /{new_total:>6.1f}"
+            f"{legacy_total / new_total:>10.2f}x  {'да' if same_owners(legacy, new) else 'НЕТ'}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Сравнение профилей OCR (fast, balanced, accurate) по скорости и точности.
+
+Генерирует «сканированные» договоры на русском, английском и вперемешку
+(contract_fixtures), распознаёт каждую страницу всеми профилями и сравнивает
+с эталонным текстом: доля верно распознанных слов и посимвольная похожесть.
+Заодно показывает, какой язык OSD выбрал для страниц.
+
+    python bench_ocr.py
+    python bench_ocr.py --profiles fast,balanced --languages ru --pages 3
+"""
+import argparse
+import difflib
+import time
+from collections import Counter
+
+from pdf2image import convert_from_bytes
+
+import ocr
+from bench_pipeline import percentile
+from contract_fixtures import contract_pages, scanned_pdf
+
+
+def normalize(text):
+    return " ".join(text.split())
+
+
+def word_accuracy(reference, hypothesis):
+    ref, hyp = reference.split(), hypothesis.split()
+    if not ref:
+        return 1.0
+    matcher = difflib.SequenceMatcher(None, ref, hyp, autojunk=False)
+    return sum(block.size for block in matcher.get_matching_blocks()) / len(ref)
+
+
+def char_similarity(reference, hypothesis):
+    return difflib.SequenceMatcher(None, reference, hypothesis, autojunk=False).ratio()
+
+
+class LanguageCounter:
+    """Считает, какой язык выбран для страниц (обёртка над ocr.detect_language)."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self._detect = ocr.detect_language
+
+    def __call__(self, image):
+        lang = self._detect(image)
+        self.counts[lang] += 1
+        return lang
+
+
+def run_profile(name, documents):
+    profile = ocr.get_profile(name)
+    languages = ocr.detect_language = LanguageCounter()
+    latencies, words, chars = [], [], []
+    started = time.perf_counter()
+    try:
+        for doc in documents:
+            t0 = time.perf_counter()
+            images = convert_from_bytes(doc["pdf"], dpi=profile["dpi"], grayscale=profile["grayscale"])
+            rasterize = (time.perf_counter() - t0) / len(images)
+            for image, reference in zip(images, doc["pages"]):
+                t0 = time.perf_counter()
+                text = normalize(ocr.ocr_page(image, profile))
+                latencies.append(time.perf_counter() - t0 + rasterize)
+                words.append(word_accuracy(reference, text))
+                chars.append(char_similarity(reference, text))
+    finally:
+        ocr.detect_language = languages._detect
+    wall = time.perf_counter() - started
+    return {
+        "pages_per_sec": round(len(latencies) / wall, 3),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "word_accuracy": round(sum(words) / len(words), 4),
+        "char_similarity": round(sum(chars) / len(chars), 4),
+        "languages": dict(languages.counts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default=",".join(ocr.OCR_PROFILES))
+    parser.add_argument("--languages", default="ru,en,mixed")
+    parser.add_argument("--pages", type=int, default=2, help="страниц в договоре на каждый язык")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    documents = []
+    for number, language in enumerate(args.languages.split(",")):
+        pages = contract_pages(args.pages, seed=args.seed + number, language=language)
+        documents.append({
+            "language": language,
+            "pdf": scanned_pdf(pages, seed=args.seed + number),
+            "pages": [normalize(" ".join(lines)) for lines in pages],
+        })
+    print(f"Договоров: {len(documents)}, страниц: {sum(len(d['pages']) for d in documents)}, движок OCR: {ocr.backend.name}\n")
+
+    print(f"{'профиль':<10}{'стр/с':>8}{'p50, мс':>10}{'p95, мс':>10}{'слова':>8}{'символы':>9}  языки")
+    for name in args.profiles.split(","):
+        report = run_profile(name, documents)
+        languages = ", ".join(f"{lang}: {count}" for lang, count in sorted(report["languages"].items())) or "rus+eng"
+        print(f"{name:<10}{report['pages_per_sec']:>8.2f}{report['p50_ms']:>10.0f}{report['p95_ms']:>10.0f}"
+              f"{report['word_accuracy']:>8.1%}{report['char_similarity']:>9.1%}  {languages}")
+
+
+if __name__ == "__main__":
+    main()
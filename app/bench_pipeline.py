@@ -0,0 +1,188 @@
+"""Бенчмарк конвейера обработки договоров: OCR, очистка текста, классификация, извлечение.
+
+Генерирует цифровые и «сканированные» договоры разного объёма (contract_fixtures),
+прогоняет этапы по отдельности и печатает пропускную способность, перцентили
+задержки и пиковый RSS каждого этапа. LLM подменяется детерминированной
+заглушкой (LLM_BACKEND=fake), поэтому замеры повторяемы и не требуют Ollama.
+
+    python bench_pipeline.py                                  # все этапы
+    python bench_pipeline.py --stages rasterize,ocr,clean     # без тяжёлой модели классификации
+    python bench_pipeline.py --save-baseline bench_baseline.json
+    python bench_pipeline.py --baseline bench_baseline.json   # код выхода 1 при регрессии
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("LLM_BACKEND", "fake")
+
+import psutil
+
+from contract_fixtures import make_contract
+
+
+STAGES = ["rasterize", "ocr", "read_pdf", "clean", "classify", "process_text"]
+
+
+class PeakRss:
+    """Пиковый RSS процесса за время этапа (опрос в фоне)."""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+        return self
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run_stage(name, items, func, units):
+    """items: [(вход, объём в единицах)]; func(вход) -> результат."""
+    latencies, total_units, results = [], 0, []
+    with PeakRss() as rss:
+        started = time.perf_counter()
+        for item, amount in items:
+            t0 = time.perf_counter()
+            results.append(func(item))
+            latencies.append(time.perf_counter() - t0)
+            total_units += amount
+        wall = time.perf_counter() - started
+    report = {
+        "units": units,
+        "throughput": round(total_units / wall, 3) if wall else 0,
+        "calls": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "peak_rss_mb": round(rss.peak / 2**20, 1),
+    }
+    print(f"{name:<14}{report['throughput']:>12.2f} {units:<18}"
+          f"p50 {report['p50_ms']:>9.1f} мс  p95 {report['p95_ms']:>9.1f} мс  p99 {report['p99_ms']:>9.1f} мс"
+          f"  RSS {report['peak_rss_mb']:>7.1f} МБ")
+    return report, results
+
+
+def compare(current, baseline, tolerance):
+    """Регрессия — падение пропускной способности или рост p95 больше чем на tolerance."""
+    regressions = []
+    for stage, report in current.items():
+        base = baseline.get(stage)
+        if not base:
+            continue
+        if report["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{stage}: пропускная способность {base['throughput']} → {report['throughput']} {report['units']}")
+        if report["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{stage}: p95 {base['p95_ms']} → {report['p95_ms']} мс")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="1,3,10", help="число страниц в генерируемых договорах")
+    parser.add_argument("--kinds", default="digital,scanned")
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--profile", help="профиль OCR (по умолчанию — OCR_PROFILE)")
+    parser.add_argument("--baseline", help="JSON с прошлым прогоном для сравнения")
+    parser.add_argument("--save-baseline", help="сохранить результаты прогона в JSON")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+    # Пути относительно каталога запуска: дальше рабочий каталог меняется
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    save_baseline = os.path.abspath(args.save_baseline) if args.save_baseline else None
+
+    stages = [stage for stage in args.stages.split(",") if stage]
+    documents = []
+    for kind in args.kinds.split(","):
+        for n in (int(x) for x in args.pages.split(",")):
+            pdf, text = make_contract(n, kind, seed=args.seed + n)
+            documents.append({"kind": kind, "pages": n, "pdf": pdf, "text": text})
+    print(f"Договоров: {len(documents)}, страниц: {sum(d['pages'] for d in documents)}\n")
+
+    results = {}
+    # Файлы договоров для read_pdf — во временном каталоге
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+
+    ocr_texts = [d["text"] for d in documents]
+    if "rasterize" in stages or "ocr" in stages:
+        import ocr
+        from pdf2image import convert_from_bytes
+        # Растеризация и распознавание — с теми же настройками профиля, что и в read_pdf
+        profile = ocr.get_profile(args.profile)
+        report, rendered = run_stage(
+            "rasterize", [(d["pdf"], d["pages"]) for d in documents],
+            lambda pdf: convert_from_bytes(pdf, dpi=profile["dpi"], grayscale=profile["grayscale"]), "стр/с")
+        results["rasterize"] = report
+        if "ocr" in stages:
+            pages = [(page, 1) for doc_pages in rendered for page in doc_pages]
+            results["ocr"], _ = run_stage(
+                "ocr", pages, lambda page: ocr.ocr_page(page, profile), "стр/с")
+
+    if "read_pdf" in stages:
+        from ocr import read_pdf
+        # read_pdf работает с файлом, как после загрузки через API
+        for number, d in enumerate(documents):
+            d["path"] = os.path.join(workdir, f"contract_{number}.pdf")
+            with open(d["path"], "wb") as f:
+                f.write(d["pdf"])
+        results["read_pdf"], ocr_texts = run_stage(
+            "read_pdf", [(d["path"], d["pages"]) for d in documents],
+            lambda path: read_pdf(path, args.profile), "стр/с")
+
+    if "clean" in stages or "classify" in stages:
+        from compliance import clean_ocr_text
+        if "clean" in stages:
+            results["clean"], _ = run_stage(
+                "clean", [(text, len(text)) for text in ocr_texts], clean_ocr_text, "симв/с")
+        if "classify" in stages:
+            from compliance import get_contract_type
+            results["classify"], _ = run_stage(
+                "classify", [(text, 1) for text in ocr_texts], get_contract_type, "классиф/с")
+
+    if "process_text" in stages:
+        from processor import process_text
+        results["process_text"], _ = run_stage(
+            "process_text", [(text, 1) for text in ocr_texts], process_text, "док/с")
+
+    if save_baseline:
+        with open(save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовая линия сохранена: {save_baseline}")
+
+    if baseline:
+        with open(baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nРегрессии относительно базовой линии:")
+            for line in regressions:
+                print(f"  - {line}")
+            sys.exit(1)
+        print("\nРегрессий относительно базовой линии нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,30 @@ from langgraph.graph import StateGraph, END
 from langchain.chains import LLMChain
 from langchain.schema import BaseOutputParser
 from enum import Enum
-from langchain_community.llms import Ollama
-from transformers import pipeline
+import difflib
+import threading
 import re
 import unicodedata
+from llm_backend import make_llm, model_id
+from metrics import CLASSIFY_SECONDS, cache_hit, llm_call
+from rule_registry import RuleRegistry
+from tracing import span
+from compliance_store import document_store, verdict_cache
 
-classifier = pipeline("zero-shot-classification",  model="joeddav/xlm-roberta-large-xnli")
+CLASSIFIER_MODEL = "joeddav/xlm-roberta-large-xnli"
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    # Модель (и torch) загружаются при первой классификации, а не при импорте модуля
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                from transformers import pipeline
+                _classifier = pipeline("zero-shot-classification", model=CLASSIFIER_MODEL)
+    return _classifier
 
 
 def clean_ocr_text(text: str) -> str:
@@ -37,9 +55,11 @@ class ContractType(Enum):
 
 def get_contract_type(contract_text: str) -> ContractType:
     labels_new = [member.value for member in ContractType]
-    result_new = classifier(clean_ocr_text(contract_text), labels_new)
-    max_score_index = result_new['scores'].index(max(result_new['scores']))
-    best_label = result_new['labels'][max_score_index]
+    with CLASSIFY_SECONDS.time(), span("classify") as attrs:
+        result_new = get_classifier()(clean_ocr_text(contract_text), labels_new)
+        max_score_index = result_new['scores'].index(max(result_new['scores']))
+        best_label = result_new['labels'][max_score_index]
+        attrs["label"] = best_label
     return ContractType(best_label)
 
 
@@ -64,167 +84,51 @@ ID правила: {{id}}
 {{ "violation": false }}
 """)
 
-rules = [
-  {
-    "id": "R001",
-    "rule": "В договоре должен быть указан срок репатриации валютной выручки.",
-    "applies_to": [ContractType.PRODUCTS],
-    "references": ["Правила экспортно‑импортного валютного контроля ПНБ РК от 29.09.2023 № 78 – определение срока репатриации и порядок контроля"] 
-  },
-  {
-    "id": "R002",
-    "rule": "В договоре должны быть указаны банковские реквизиты сторон.",
-    "applies_to": [ContractType.PRODUCTS, ContractType.SERVICES, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["Закон РК об валютном регулировании и контроле, ст. 7–8 – реквизиты банков резидентов/нерезидентов"]
-  },
-  {
-    "id": "R004",
-    "rule": "Валютные операции между резидентами РК запрещены вне внутреннего валютного рынка.",
-    "applies_to": [ContractType.PRODUCTS, ContractType.SERVICES, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["Закон РК об валютном регулировании и контроле, ст. 6–7 (валютные операции между резидентами/нерезидентами)"]
-  },
-  {
-    "id": "R005",
-    "rule": "В договоре должна быть указана сумма сделки.",
-    "applies_to": [ContractType.PRODUCTS, ContractType.SERVICES, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["ПНБ – сумма договора используется при определении порога учета и репатриации"]
-  },
-  {
-    "id": "R006",
-    "rule": "Если сумма договора > 10 млн ₸ (≈50 000 USD) — договор должен быть зарегистрирован в НБ РК (учётный номер / паспорт сделки) до начала исполнения.",
-    "applies_to": [ContractType.PRODUCTS, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["Закон РК «О валютном регулировании и…», ст. 9; Правила экспортно‑импортного контроля, п. 49 и след."]
-  },
-  {
-    "id": "R009",
-    "rule": "Дата договора должна совпадать во всех языковых версиях.",
-    "applies_to": [ContractType.PRODUCTS, ContractType.SERVICES, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["Комплаенс‑правила банков по верификации и переводу документов"] 
-  },
-  {
-    "id": "R011",
-    "rule": "Для товарных договоров должен быть указан код ТН ВЭД.",
-    "applies_to": [ContractType.PRODUCTS],
-    "references": ["Таможенный кодекс ЕАЭС – классификация товаров; банковский валютный контроль"] 
-  },
-  {
-    "id": "R012",
-    "rule": "Если договор на иностранном языке — обязателен перевод на русский или казахский.",
-    "applies_to": [ContractType.PRODUCTS, ContractType.SERVICES, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["Правила экспортно‑импортного валютного контроля ПНБ; Закон РК «О валютном регулировании…», ст. 9"]
-  },
-  {
-    "id": "R013",
-    "rule": "В договоре должен быть указан номер договора.",
-    "applies_to": [ContractType.PRODUCTS, ContractType.SERVICES, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["Комплаенс‑требования банковского документооборота"] 
-  },
-  {
-    "id": "R014",
-    "rule": "В договоре должна быть указана валюта расчётов.",
-    "applies_to": [ContractType.PRODUCTS, ContractType.SERVICES, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["Закон РК «О валютном регулировании…», ст. 7–8"]
-  },
-  {
-    "id": "R015",
-    "rule": "Условия и порядок оплаты (валюта, сроки, реквизиты, банк‑корреспондент) должны быть четко прописаны.",
-    "applies_to": [ContractType.PRODUCTS, ContractType.SERVICES, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["Закон РК «О валютном регулировании…», ст. 7; Правила ПНБ по валютным операциям"]
-  },
-  {
-    "id": "R016",
-    "rule": "В товарных договорах — должны быть условия поставки (Incoterms или эквивалент).",
-    "applies_to": [ContractType.PRODUCTS],
-    "references": ["Таможенные и логистические нормы ЕАЭС; комплаенс‑требования банков"] 
-  },
-  {
-    "id": "R017",
-    "rule": "В договоре должны быть указаны сроки исполнения обязательств (поставка, услуги, возврат займа и т.д.).",
-    "applies_to": [ContractType.PRODUCTS, ContractType.SERVICES, ContractType.LOANS, ContractType.INVESTMENTS],
-    "references": ["Закон РК «О гражданских обязательствах»; комплаенс‑правила"] 
-  },
-  {
-    "id": "R018",
-    "rule": "Если это договор на услуги — указывать объект, объем, срок и результат.",
-    "applies_to": [ContractType.SERVICES],
-    "references": ["Гражданский кодекс РК; банковские комплаенс‑правила"] 
-  },
-  {
-    "id": "R019",
-    "rule": "Если это займ/кредит — указывать сумму, процент, срок, способ возврата.",
-    "applies_to": [ContractType.LOANS],
-    "references": ["Закон РК «О займах и кредитах»; Регламент ПНБ"] 
-  },
-  {
-    "id": "R020",
-    "rule": "Инвестиционный договор: указать обязательства сторон, сроки, форму внесения инвестиций.",
-    "applies_to": [ContractType.INVESTMENTS],
-    "references": ["Закон РК «Об инвестициях»; валютное законодательство"] 
-  },
-  {
-    "id": "S001",
-    "rule": "В договоре на оказание услуг должен быть четко определен предмет договора (что именно предоставляется).",
-    "applies_to": [ContractType.SERVICES],
-    "references": ["Гражданский кодекс РК, ст. 384; Положения банковского комплаенса"]
-  },
-  {
-    "id": "S002",
-    "rule": "Должны быть указаны сроки начала и окончания оказания услуг.",
-    "applies_to": [ContractType.SERVICES],
-    "references": ["ГК РК, ст. 386; требования комплаенс-служб банков"]
-  },
-  {
-    "id": "S003",
-    "rule": "В договоре должен быть указан объем или формат оказания услуг (единицы, часы, этапы и пр.).",
-    "applies_to": [ContractType.SERVICES],
-    "references": ["ГК РК, ст. 387"]
-  },
-  {
-    "id": "S008",
-    "rule": "Договор должен содержать результат оказания услуг (отчет, акт, продукт и пр.).",
-    "applies_to": [ContractType.SERVICES],
-    "references": ["ГК РК, ст. 388"]
-  },
-  {
-    "id": "L001",
-    "rule": "В договоре займа или кредита должна быть указана процентная ставка или условие её отсутствия.",
-    "applies_to": [ContractType.LOANS],
-    "references": ["Гражданский кодекс РК, ст. 715, 716"]
-  },
-  {
-    "id": "L003",
-    "rule": "В договоре должен быть указан график возврата займа (дата/этапы, сумма, периодичность).",
-    "applies_to": [ContractType.LOANS],
-    "references": ["Гражданский кодекс РК, ст. 717; Комплаенс-требования банков по контролю валютных операций"]
-  }
-]
+# Правила — в rules.json (путь — COMPLIANCE_RULES_PATH), перечитываются при изменении файла
+rule_registry = RuleRegistry(prompt=rule_check_prompt.template, resolve_type=lambda name: ContractType[name])
+
 
 # Output parser
 class SimpleJSONParser(BaseOutputParser):
+    # Ответ модели не разобран: нарушение не засчитываем, но и не кэшируем такой «вердикт»
+    FALLBACK = {"violation": False, "parse_error": True}
+
     def parse(self, text: str):
         import json, re
         try:
             match = re.search(r"\{.*?\}", text, re.DOTALL)
-            return json.loads(match.group()) if match else {"violation": False}
+            return json.loads(match.group()) if match else dict(self.FALLBACK)
         except Exception:
-            return {"violation": False}
+            return dict(self.FALLBACK)
 
 parser = SimpleJSONParser()
 
 
 class ContractState(dict):
     contract_text: str
+    text_hash: str
     violations: list
+    verdicts: dict
 
 
 def make_agent_node(rule):
-    chain = LLMChain(prompt=rule_check_prompt, llm=Ollama(model="llama3:70b-instruct-q2_K"), output_parser=parser)
+    chain = LLMChain(prompt=rule_check_prompt, llm=make_llm(), output_parser=parser)
+    model = model_id()
     def node(state: ContractState):
-        result = chain.run(
-            contract_text=state["contract_text"],
-            rule=rule["rule"],
-            id=rule["id"]
-        )
+        # Тот же текст, та же версия правила и та же модель — вердикт уже известен
+        result = verdict_cache.get(state["text_hash"], rule, model)
+        cache_hit("compliance_verdict", result is not None)
+        if result is None:
+            with llm_call("compliance", rule["id"]), span("rule", rule_id=rule["id"]) as attrs:
+                result = chain.run(
+                    contract_text=state["contract_text"],
+                    rule=rule["rule"],
+                    id=rule["id"]
+                )
+                attrs["violation"] = bool(result.get("violation"))
+            if not result.get("parse_error"):
+                verdict_cache.put(state["text_hash"], rule, model, result)
+        state["verdicts"][rule["id"]] = result
         if result.get("violation"):
             state["violations"].append(result)
         return state
@@ -252,40 +156,129 @@ def build_graph(rules):
     return graph.compile()
 
 
-def compliance_validation(contract_text: str):
+def split_paragraphs(text: str) -> list:
+    """Абзацы по пустым строкам; если их нет — по строкам, если и строк нет — по предложениям."""
+    for pattern in (r"\n\s*\n", r"\n", r"(?<=[.;!?])\s+"):
+        paragraphs = [" ".join(part.split()) for part in re.split(pattern, text)]
+        paragraphs = [part for part in paragraphs if part]
+        if len(paragraphs) > 1:
+            return paragraphs
+    return paragraphs
 
-    contract_type = get_contract_type(contract_text)
-    
-    initial_state = {
-        "contract_text": contract_text,
-        "violations": []
-    }
-    product_rules = [
-        rule for rule in rules
+
+def changed_paragraphs(old_text: str, new_text: str) -> list:
+    """Удалённые, добавленные и изменённые абзацы (обе стороны замены)."""
+    old, new = split_paragraphs(old_text), split_paragraphs(new_text)
+    changed = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if tag != "equal":
+            changed.extend(old[i1:i2] + new[j1:j2])
+    return changed
+
+
+def rule_affected(rule, changed: list) -> bool:
+    if not changed:
+        return False
+    keywords = rule.get("keywords")
+    if not keywords:
+        return True
+    return any(keyword in paragraph.lower() for paragraph in changed for keyword in keywords)
+
+
+def rule_stamp(rule) -> str:
+    return f"{rule['version']}:{rule['hash']}"
+
+
+def applicable_rules(contract_type: ContractType):
+    return [
+        rule for rule in rule_registry.rules()
         if contract_type.value in [
             x.value if isinstance(x, Enum) else x for x in rule["applies_to"]
         ]
     ]
-    graph = build_graph(product_rules)
+
+
+def run_rules(contract_text: str, rules_to_check) -> dict:
+    """Вердикты {rule_id: ответ модели} по указанным правилам."""
+    if not rules_to_check:
+        return {}
+    initial_state = {
+        "contract_text": contract_text,
+        "text_hash": verdict_cache.text_hash(contract_text),
+        "violations": [],
+        "verdicts": {},
+    }
+    graph = build_graph(rules_to_check)
     final_state = graph.invoke(initial_state)
+    return final_state["verdicts"] if final_state else {}
+
+
+def compliance_report(contract_text: str, document_id: str = None, contract_type: ContractType = None) -> dict:
+    """Проверка договора; с document_id — инкрементальная относительно прошлой редакции.
+
+    Прошлая редакция сравнивается с новой по абзацам, и заново проверяются только
+    правила, чьи абзацы (по ключевым словам) изменились; остальные вердикты берутся
+    из прошлой проверки. Если сменился тип договора, проверяется всё; правила,
+    изменённые в реестре с прошлой проверки, проверяются заново.
+    contract_type, если уже известен, повторно не определяется.
+    """
+    contract_type = contract_type or get_contract_type(contract_text)
+    product_rules = applicable_rules(contract_type)
+    previous = document_store.get(document_id) if document_id else None
 
-    # Show violations
-    # for v in final_state['violations']:
-        # print(f"❌ Rule {v['rule_id']} violated:\nReason: {v['reason']}\nMatched: {v['matched_text']}\n")
+    # Прошлые вердикты действительны, только пока не поменялось само правило (неразобранные — не вердикты)
+    known = {}
+    if previous and previous["contract_type"] == contract_type.value:
+        for rule in product_rules:
+            stored = previous["verdicts"].get(rule["id"])
+            if (isinstance(stored, dict) and stored.get("stamp") == rule_stamp(rule)
+                    and not stored["verdict"].get("parse_error")):
+                known[rule["id"]] = stored["verdict"]
+
+    if known:
+        with span("compliance.diff") as attrs:
+            changed = changed_paragraphs(previous["text"], contract_text)
+            attrs["changed_paragraphs"] = len(changed)
+        to_check = [
+            rule for rule in product_rules
+            if rule["id"] not in known or rule_affected(rule, changed)
+        ]
+    else:
+        to_check = product_rules
+
+    verdicts = run_rules(contract_text, to_check)
+    reused = []
+    for rule in product_rules:
+        if rule["id"] not in verdicts and rule["id"] in known:
+            verdicts[rule["id"]] = known[rule["id"]]
+            reused.append(rule["id"])
+
+    revision = None
+    if document_id:
+        stamped = {
+            rule["id"]: {"stamp": rule_stamp(rule), "verdict": verdicts[rule["id"]]}
+            for rule in product_rules if rule["id"] in verdicts
+        }
+        revision = document_store.put(document_id, contract_text, contract_type.value, stamped)
 
-    if not final_state:
-        return []
-        
     filtered_results = []
-    for rule in rules:
-        for violation in final_state['violations']:
-            if violation['rule_id'] == rule['id']:
-                filtered_results.append({
-                    'rule_id': rule['id'],
-                    'rule': rule['rule'],
-                    'matched_text': violation['matched_text'],
-                    'references': rule['references']
-                })
-    return filtered_results
-    
+    for rule in product_rules:
+        verdict = verdicts.get(rule["id"])
+        if verdict and verdict.get("violation"):
+            filtered_results.append({
+                'rule_id': rule['id'],
+                'rule': rule['rule'],
+                'matched_text': verdict.get('matched_text'),
+                'references': rule['references']
+            })
+    return {
+        "violations": filtered_results,
+        "contract_type": contract_type.value,
+        "revision": revision,
+        "rechecked": [rule["id"] for rule in to_check],
+        "reused": reused,
+    }
+
 
+def compliance_validation(contract_text: str, document_id: str = None):
+    return compliance_report(contract_text, document_id)["violations"]
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+# --- Настройки (через переменные окружения) ---
+STORE_PATH = os.getenv("COMPLIANCE_STORE_PATH", ".compliance_store/documents.sqlite")
+
+
+class DocumentStore:
+    """Последняя проверенная версия каждого договора: текст, тип и вердикты по правилам.
+
+    Ключ — document_id, который присылает клиент. По нему следующая редакция
+    договора сравнивается с предыдущей, и перепроверяются только затронутые правила.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS documents (
+                    document_id TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    contract_type TEXT NOT NULL,
+                    verdicts TEXT NOT NULL,
+                    revision INTEGER NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+            self._db.commit()
+        return self._db
+
+    def get(self, document_id: str) -> Optional[dict]:
+        """Возвращает {"text", "contract_type", "verdicts": {rule_id: {"stamp", "verdict"}}, "revision"} или None."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT text, contract_type, verdicts, revision FROM documents WHERE document_id = ?", (document_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        text, contract_type, verdicts, revision = row
+        return {"text": text, "contract_type": contract_type, "verdicts": json.loads(verdicts), "revision": revision}
+
+    def put(self, document_id: str, text: str, contract_type: str, verdicts: dict) -> int:
+        """Сохраняет новую редакцию и возвращает её номер."""
+        with self._lock:
+            db = self._connect()
+            row = db.execute("SELECT revision FROM documents WHERE document_id = ?", (document_id,)).fetchone()
+            revision = row[0] + 1 if row else 1
+            db.execute(
+                "INSERT OR REPLACE INTO documents (document_id, text, contract_type, verdicts, revision, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (document_id, text, contract_type, json.dumps(verdicts, ensure_ascii=False), revision, time.time()),
+            )
+            db.commit()
+        return revision
+
+    def delete(self, document_id: str):
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+            db.commit()
+
+
+class VerdictCache:
+    """Вердикты LLM по ключу (хэш текста договора, id правила, версия и hash правила, модель).
+
+    Правка правила меняет его версию или hash, и старые вердикты этого правила
+    просто перестают находиться; вердикты остальных правил остаются в силе.
+    """
+
+    def __init__(self, path: str = STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS verdicts (
+                    text_hash TEXT NOT NULL,
+                    rule_id TEXT NOT NULL,
+                    rule_version INTEGER NOT NULL,
+                    rule_hash TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    verdict TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (text_hash, rule_id, rule_version, rule_hash, model)
+                )"""
+            )
+            self._db.commit()
+        return self._db
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, text_hash: str, rule: dict, model: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT verdict FROM verdicts WHERE text_hash = ? AND rule_id = ? AND rule_version = ? AND rule_hash = ? AND model = ?",
+                (text_hash, rule["id"], rule["version"], rule["hash"], model),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, text_hash: str, rule: dict, model: str, verdict: dict):
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO verdicts (text_hash, rule_id, rule_version, rule_hash, model, verdict, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (text_hash, rule["id"], rule["version"], rule["hash"], model, json.dumps(verdict, ensure_ascii=False), time.time()),
+            )
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            db = self._connect()
+            db.execute("DELETE FROM verdicts")
+            db.commit()
+
+
+document_store = DocumentStore()
+verdict_cache = VerdictCache()
@@ -0,0 +1,144 @@
+"""Синтетические валютные договоры для бенчмарков OCR и извлечения.
+
+Цифровой PDF содержит текстовый слой; «скан» — те же страницы, растеризованные
+в картинку с лёгким шумом и наклоном, без текстового слоя. Вместе с PDF
+возвращается исходный текст — эталон для оценки качества OCR.
+"""
+import io
+import random
+from typing import List, Tuple
+
+import fitz  # pymupdf
+from PIL import Image, ImageFilter
+
+
+FONT = "china-s"  # встроенный шрифт PyMuPDF с кириллицей
+FONT_SIZE = 11
+LINE_HEIGHT = 15
+MARGIN = 60
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 в пунктах
+
+CLAUSES_RU = [
+    "Продавец обязуется поставить, а Покупатель принять и оплатить товар в количестве и ассортименте согласно спецификации.",
+    "Общая сумма договора составляет {amount} {currency} и включает стоимость товара, упаковки и маркировки.",
+    "Оплата производится банковским переводом на расчётный счёт Продавца в течение {days} календарных дней.",
+    "Срок репатриации валютной выручки составляет {days} дней с даты поставки товара.",
+    "Поставка осуществляется на условиях {incoterms} в соответствии с Инкотермс 2020.",
+    "Код товара по ТН ВЭД ЕАЭС: {hs_code}.",
+    "Все споры разрешаются путём переговоров, а при недостижении согласия — в арбитражном суде.",
+    "Стороны не несут ответственности за неисполнение обязательств вследствие обстоятельств непреодолимой силы.",
+    "Настоящий договор вступает в силу с момента подписания и действует до полного исполнения обязательств.",
+    "Банк Продавца: АО «Банк», SWIFT {swift}, счёт {account}.",
+]
+CLAUSES_EN = [
+    "The Seller shall deliver and the Buyer shall accept and pay for the goods according to the specification.",
+    "The total amount of the contract is {amount} {currency}, including packing and marking.",
+    "Payment shall be made by bank transfer within {days} calendar days after delivery.",
+    "Delivery terms: {incoterms} according to Incoterms 2020.",
+    "Seller's bank: JSC Bank, SWIFT {swift}, account {account}.",
+]
+
+
+def _wrap(text: str) -> List[str]:
+    width = PAGE_WIDTH - 2 * MARGIN
+    lines, line = [], ""
+    for word in text.split():
+        if line and fitz.get_text_length(f"{line} {word}", fontname=FONT, fontsize=FONT_SIZE) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def contract_pages(n_pages: int, seed: int = 0, language: str = "ru") -> List[List[str]]:
+    """Строки договора по страницам; language: ru, en или mixed (чередование страниц)."""
+    rng = random.Random(seed)
+    lines_per_page = int((PAGE_HEIGHT - 2 * MARGIN) / LINE_HEIGHT)
+    values = {
+        "amount": f"{rng.randint(10, 9000) * 1000:,}".replace(",", " "),
+        "currency": rng.choice(["USD", "EUR", "RUB", "KZT"]),
+        "days": rng.choice([30, 60, 90, 180]),
+        "incoterms": rng.choice(["DAP", "FCA", "CIF", "EXW"]),
+        "hs_code": f"{rng.randint(1000, 9999)} {rng.randint(10, 99)} {rng.randint(100, 999)} 0",
+        "swift": "".join(rng.choice("ABCDEFGHKLMNPRSTUVWXYZ") for _ in range(8)),
+        "account": "KZ" + "".join(str(rng.randint(0, 9)) for _ in range(18)),
+    }
+    pages = []
+    for number in range(n_pages):
+        page_language = language if language != "mixed" else ("ru" if number % 2 == 0 else "en")
+        clauses = CLAUSES_RU if page_language == "ru" else CLAUSES_EN
+        if number == 0:
+            title = "ДОГОВОР ПОСТАВКИ № {}/{}".format(rng.randint(1, 999), rng.randint(20, 25))
+            lines = [title if page_language == "ru" else f"SUPPLY CONTRACT No. {rng.randint(1, 999)}", ""]
+        else:
+            lines = []
+        clause_no = 1
+        while len(lines) < lines_per_page - 3:
+            clause = rng.choice(clauses).format(**values)
+            lines += _wrap(f"{number + 1}.{clause_no}. {clause}")
+            clause_no += 1
+        pages.append(lines[:lines_per_page])
+    return pages
+
+
+def digital_pdf(pages: List[List[str]]) -> bytes:
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        y = MARGIN
+        for line in lines:
+            page.insert_text((MARGIN, y), line, fontname=FONT, fontsize=FONT_SIZE)
+            y += LINE_HEIGHT
+    pdf = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return pdf
+
+
+def _scan(image, rng):
+    """«Скан» страницы: небольшой перекос, размытие и точки шума."""
+    image = image.rotate(rng.uniform(-0.7, 0.7), fillcolor=255, resample=Image.BICUBIC)
+    image = image.filter(ImageFilter.GaussianBlur(0.4))
+    pixels = image.load()
+    for _ in range(image.width * image.height // 2000):
+        pixels[rng.randrange(image.width), rng.randrange(image.height)] = rng.randint(0, 120)
+    return image
+
+
+def scanned_pdf(pages: List[List[str]], dpi: int = 200, seed: int = 0, blank_pages=(), duplicate_pages=()) -> bytes:
+    """Растеризует договор в картинки с шумом; blank_pages/duplicate_pages — номера страниц после
+    которых вставить пустой лист-разделитель / повтор страницы (для проверки отсева страниц)."""
+    rng = random.Random(seed)
+    source = fitz.open(stream=digital_pdf(pages), filetype="pdf")
+    images = []
+    for number, page in enumerate(source):
+        pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+        clean = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+        image = _scan(clean, rng)
+        images.append(image)
+        if number in duplicate_pages:
+            # Повтор — тот же лист, отсканированный ещё раз: свой перекос и свой шум
+            images.append(_scan(clean, random.Random(f"{seed}:{number}:duplicate")))
+        if number in blank_pages:
+            images.append(Image.new("L", image.size, 250))
+    source.close()
+
+    doc = fitz.open()
+    for image in images:
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=False)
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page.insert_image(page.rect, stream=buffer.getvalue())
+    pdf = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return pdf
+
+
+def make_contract(n_pages: int, kind: str = "digital", seed: int = 0, language: str = "ru") -> Tuple[bytes, str]:
+    """PDF договора и эталонный текст; kind: digital или scanned."""
+    pages = contract_pages(n_pages, seed, language)
+    text = "\n".join("\n".join(lines) for lines in pages)
+    pdf = digital_pdf(pages) if kind == "digital" else scanned_pdf(pages, seed=seed)
+    return pdf, text
@@ -1,147 +1,361 @@
-import fitz  # pymupdf
-import re
-import requests
+import asyncio
+import logging
+import os
 import time
-import json
+import httpx
+from fns_governor import LookupTimeout, governor, make_deadline
+from egrul_cache import extract_cache
+from egrul_parser import PARSER_VERSION, parse_owners
+from metrics import EGRUL_FETCH_QUEUE, EGRUL_FETCHES_IN_FLIGHT, cache_hit
+from singleflight import SingleFlight
+from tracing import span
 from typing import List, Dict
 
 
+logger = logging.getLogger(__name__)
 
-BASE_URL = "https://egrul.nalog.ru"
+BASE_URL = os.getenv("EGRUL_BASE_URL", "https://egrul.nalog.ru")
 HEADERS = {"Content-Type": "application/x-www-form-urlencoded; charset=UTF-8"}
-session = requests.Session()
+# Сколько запросов к ФНС может выполняться одновременно в рамках одного обхода
+MAX_CONCURRENCY = int(os.getenv("EGRUL_MAX_CONCURRENCY", "5"))
+# Бюджет одного обхода по умолчанию: глубина, число загруженных выписок, общее время
+MAX_DEPTH = int(os.getenv("EGRUL_MAX_DEPTH", "10"))
+MAX_FETCHES = int(os.getenv("EGRUL_MAX_FETCHES", "200"))
+TRAVERSAL_TIMEOUT = float(os.getenv("EGRUL_TRAVERSAL_TIMEOUT", "120"))
+# Для пакетных проверок бюджет общий на весь пакет
+BATCH_MAX_FETCHES = int(os.getenv("EGRUL_BATCH_MAX_FETCHES", "5000"))
+BATCH_TIMEOUT = float(os.getenv("EGRUL_BATCH_TIMEOUT", "900"))
 
 
 # --- Работа с API ФНС ---
-def search(query):
-    response = session.post(f"{BASE_URL}/", headers=HEADERS, data={"query": query})
-    response.raise_for_status()
+# Все запросы идут через governor: общий лимит частоты, ретраи и дедлайн
+async def search(client, query, deadline):
+    response = await governor.request(client, "POST", f"{BASE_URL}/", deadline, "search", headers=HEADERS, data={"query": query})
     data = response.json()
-    print(f"🔍 Поиск: {query} → Ответ: {data}")
+    logger.debug("Поиск: %s → ответ: %s", query, data)
     return data["t"]
 
-def wait_for_result(t):
+async def wait_for_result(client, t, deadline):
     poll_url = f"{BASE_URL}/search-result/{t}"
-    while True:
-        r = session.get(poll_url)
-        r.raise_for_status()
+
+    async def check():
+        r = await governor.request(client, "GET", poll_url, deadline, "poll")
         data = r.json()
         if data.get("status") == "wait":
-            time.sleep(1)
+            return None
         elif data.get("rows"):
             return data["rows"][0]["t"]
         else:
             raise Exception("Ошибка: пустой ответ или неизвестный статус")
 
-def request_vyp(t):
+    return await governor.poll(check, deadline)
+
+async def request_vyp(client, t, deadline):
     url = f"{BASE_URL}/vyp-request/{t}"
-    r = session.get(url)
-    r.raise_for_status()
+    r = await governor.request(client, "GET", url, deadline, "vyp_request")
     return r.json()["t"]
 
-def download_pdf(t):
+async def download_pdf(client, t, deadline):
     url = f"{BASE_URL}/vyp-download/{t}"
-    r = session.get(url)
-    r.raise_for_status()
+    r = await governor.request(client, "GET", url, deadline, "download")
     return r.content
 
-def get_pdf_by_inn_or_name(query):
+async def get_pdf_by_inn_or_name(client, query, deadline=None):
+    """PDF выписки или None, если ФНС её не отдала.
+
+    Если истёк переданный дедлайн (бюджет вызывающего), а не таймаут самого
+    запроса, LookupTimeout пробрасывается: выписка тут ни при чём.
+    """
+    lookup_deadline = make_deadline()
+    callers_deadline = deadline is not None and deadline < lookup_deadline
+    deadline = min(lookup_deadline, deadline) if deadline else lookup_deadline
     try:
-        t1 = search(query)
-        t2 = wait_for_result(t1)
-        t3 = request_vyp(t2)
-        return download_pdf(t3)
+        with span("fns.search", query=query):
+            t1 = await search(client, query, deadline)
+        with span("fns.poll", query=query):
+            t2 = await wait_for_result(client, t1, deadline)
+        with span("fns.download", query=query) as attrs:
+            t3 = await request_vyp(client, t2, deadline)
+            pdf = await download_pdf(client, t3, deadline)
+            attrs["bytes"] = len(pdf)
+        return pdf
+    except LookupTimeout:
+        if callers_deadline:
+            raise
+        logger.warning("Таймаут при получении PDF по запросу %s", query)
+        return None
     except Exception as e:
-        print(f"[!] Ошибка при получении PDF по запросу {query}: {e}")
+        logger.warning("Ошибка при получении PDF по запросу %s: %s", query, e)
         return None
 
 
-# --- Парсинг PDF ---
-def parse_pdf_to_lines(pdf_bytes):
-    doc = fitz.open("pdf", pdf_bytes)
-    lines = []
-    for page in doc:
-        lines.extend(page.get_text().splitlines())
-    return lines
-
-def find_inn_above_or_below(lines, index, lookahead=30):
-    # Вниз
-    for j in range(index, min(index + lookahead, len(lines))):
-        match_inline = re.search(r'ИНН.*?(\d{10,12})', lines[j])
-        if match_inline:
-            return match_inline.group(1)
-        if lines[j].strip().upper() == "ИНН" and j + 1 < len(lines):
-            match = re.search(r'\d{10,12}', lines[j + 1])
-            if match:
-                return match.group()
-
-    # Вверх
-    for j in range(index - 1, max(index - lookahead, -1), -1):
-        match_inline = re.search(r'ИНН.*?(\d{10,12})', lines[j])
-        if match_inline:
-            return match_inline.group(1)
-        if lines[j].strip().upper() == "ИНН" and j + 1 < len(lines):
-            match = re.search(r'\d{10,12}', lines[j + 1])
-            if match:
-                return match.group()
-
-    return None
-
-def find_share_nearby(lines, start_index):
-    for j in range(start_index, min(start_index + 30, len(lines))):
-        if "Номинальная стоимость доли" in lines[j]:
-            if j + 1 < len(lines):
-                match = re.search(r'\d+', lines[j + 1])
-                if match:
-                    return match.group()
-    return None
-
-def extract_fio_block(lines, index):
-    try:
-        return f"{lines[index + 3].strip()} {lines[index + 4].strip()} {lines[index + 5].strip()}"
-    except IndexError:
-        return None
+class BudgetExhausted(Exception):
+    def __init__(self, reason):
+        super().__init__(f"Исчерпан бюджет обхода: {reason}")
+        self.reason = reason
+
+
+class ExtractUnavailable(Exception):
+    """ФНС не отдала выписку (после всех ретраев, по таймауту запроса, при троттлинге)."""
+
+    reason = "fetch_failed"
+
+
+class FetchAborted(Exception):
+    """Загрузка прервана, потому что её обход завершился (закрыт HTTP-клиент)."""
+
+
+# Загрузки выписок, общие для всех запросов процесса: если выписку по ИНН уже
+# скачивает другой обход (например, та же материнская компания в пакете
+# онбординга), ждём его результата, а не идём в ФНС второй раз
+extract_flights = SingleFlight("egrul_extract")
+
+
+class TraversalBudget:
+    """Ограничения одного запроса: глубина, число выписок из ФНС и общий дедлайн."""
+
+    def __init__(self, max_depth=None, max_fetches=None, timeout=None):
+        self.max_depth = MAX_DEPTH if max_depth is None else max_depth
+        self.max_fetches = MAX_FETCHES if max_fetches is None else max_fetches
+        self.timeout = TRAVERSAL_TIMEOUT if timeout is None else timeout
+        self.deadline = time.monotonic() + self.timeout
+        self.fetches = 0
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def allows_depth(self, depth):
+        return depth <= self.max_depth
+
+    def check_deadline(self):
+        if self.remaining() <= 0:
+            raise BudgetExhausted("deadline")
+
+    def take_fetch(self):
+        self.check_deadline()
+        if self.fetches >= self.max_fetches:
+            raise BudgetExhausted("max_fetches")
+        self.fetches += 1
+
+    def limits(self):
+        return {"max_depth": self.max_depth, "max_fetches": self.max_fetches, "timeout_sec": self.timeout}
+
+
+class OwnerLoader:
+    """Загрузка разобранных выписок в рамках одной работы (запроса или пакета).
 
-def extract_owners_from_pdf(pdf_bytes, level=0, visited_inn=None):
-    visited_inn = visited_inn or set()
-    owners = []
-
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    lines = [line.strip() for page in doc for line in page.get_text().splitlines()]
-
-    i = 0
-    while i < len(lines):
-        # 1. Физическое лицо
-        if lines[i].upper() == "ФАМИЛИЯ" and i + 5 < len(lines):
-            fio = f"{lines[i+1]} {lines[i+3]} {lines[i+5]}"
-            share = find_share_nearby(lines, i)
-            owners.append({"ФИО": fio, "ИНН": None, "Доля (руб)": share})
-            print(f"{'  '*level}👤 Найден физ.лицо: {fio}, Доля: {share}")
-            i += 6
-            continue
-
-        # 2. Юрлицо — ищем по словам "ООО", "АО", "ПАО"
-        if re.search(r'\b(ООО|АО|ПАО)\b', lines[i]):
-            org_name = lines[i]
-            inn = find_inn_above_or_below(lines, i)
-            print(f"{'  '*level}🏢 Найдено юрлицо: {org_name}, ИНН: {inn}")
-            if inn and inn not in visited_inn:
-                visited_inn.add(inn)
-                print(f"{'  '*level}🔁 Запрашиваем выписку по ИНН {inn} ({org_name})")
-                child_pdf = get_pdf_by_inn_or_name(inn)
-                if child_pdf:
-                    child_owners = extract_owners_from_pdf(child_pdf, level+1, visited_inn)
-                    owners.extend(child_owners)
-                else:
-                    print(f"{'  '*level}⚠️ Не удалось получить PDF по ИНН {inn}")
+    Общий HTTP-клиент, общий лимит одновременных запросов к ФНС и
+    дедупликация по ИНН: каждая выписка загружается не больше одного раза,
+    сколько бы обходов её ни запросили. Между разными работами загрузки
+    одной выписки объединяются через extract_flights.
+    """
+
+    def __init__(self, client, budget=None, max_concurrency=MAX_CONCURRENCY):
+        self.client = client
+        self.budget = budget or TraversalBudget()
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks = {}
+        self.stats = {"requested": 0, "unique": 0, "cache_hits": 0, "coalesced": 0, "fetched": 0, "failed": 0}
+
+    async def load(self, inn, level=0):
+        """Возвращает (физлица, юрлица) из выписки по ИНН.
+
+        BudgetExhausted — бюджет обхода исчерпан, ExtractUnavailable — ФНС не отдала
+        выписку; в обоих случаях компания попадает в нераскрытые (unexpanded).
+        """
+        self.stats["requested"] += 1
+        task = self._tasks.get(inn)
+        if task is None:
+            self.stats["unique"] += 1
+            task = self._tasks[inn] = asyncio.ensure_future(self._load(inn, level))
+        return await task
+
+    async def _load(self, inn, level):
+        self.budget.check_deadline()
+        # Кэш — SQLite и файлы на диске: в пуле потоков, чтобы не задерживать другие обходы
+        cached = await asyncio.to_thread(extract_cache.get, inn)
+        cache_hit("egrul_extract", cached is not None)
+        if cached and cached["parsed"] is not None and cached["parser_version"] == PARSER_VERSION:
+            logger.debug("Выписка по ИНН %s взята из кэша (уровень %d)", inn, level)
+            self.stats["cache_hits"] += 1
+            return cached["parsed"]
+
+        if cached:
+            self.stats["cache_hits"] += 1
+            try:
+                return await self._parse(inn, cached["pdf_path"], level)
+            except FileNotFoundError:
+                # Выписку вытеснили из кэша между get и разбором — загружаем заново
+                logger.debug("Выписка по ИНН %s пропала из кэша, загружаем заново", inn)
+
+        if inn in extract_flights:
+            self.stats["coalesced"] += 1
+        try:
+            # Чужую загрузку ждём не дольше своего бюджета; если у того обхода
+            # кончился его бюджет или он завершился, загружаем сами
+            return await extract_flights.do(
+                inn, lambda: self._fetch(inn, level), retry_on=(BudgetExhausted, FetchAborted),
+                timeout=self.budget.remaining(),
+            )
+        except asyncio.TimeoutError:
+            raise BudgetExhausted("deadline")
+        except ExtractUnavailable:
+            self.budget.check_deadline()
+            logger.warning("Не удалось получить PDF по ИНН %s", inn)
+            self.stats["failed"] += 1
+            raise
+
+    async def _fetch(self, inn, level):
+        with EGRUL_FETCH_QUEUE.track_inprogress():
+            await self.semaphore.acquire()
+        try:
+            # Бюджет списываем только за реальные обращения к ФНС, кэш бесплатен
+            self.budget.take_fetch()
+            with EGRUL_FETCHES_IN_FLIGHT.track_inprogress():
+                pdf = await get_pdf_by_inn_or_name(self.client, inn, self.budget.deadline)
+        except LookupTimeout:
+            raise BudgetExhausted("deadline")
+        finally:
+            self.semaphore.release()
+        if not pdf:
+            if self.client.is_closed:
+                raise FetchAborted(inn)
+            raise ExtractUnavailable(inn)
+        self.stats["fetched"] += 1
+        # Дальше работаем с файлом в кэше, а не с копией в памяти; без кэша — с байтами
+        path = await asyncio.to_thread(extract_cache.put_pdf, inn, pdf)
+        try:
+            return await self._parse(inn, path or pdf, level)
+        except FileNotFoundError:
+            return await self._parse(inn, pdf, level)
+
+    async def _parse(self, inn, source, level):
+        # Разбор PDF — CPU-работа, не блокируем цикл событий
+        with span("egrul.parse", inn=inn):
+            persons, companies = await asyncio.to_thread(parse_owners, source, level)
+        await asyncio.to_thread(extract_cache.put_parsed, inn, [persons, companies], PARSER_VERSION)
+        return persons, companies
+
+    def summary(self):
+        # Сколько обращений к ФНС сэкономили дедупликация и кэш
+        return {
+            **self.stats,
+            "saved_fetches": self.stats["requested"] - self.stats["fetched"] - self.stats["failed"],
+            "budget": self.budget.limits(),
+        }
+
+async def traverse_owners(loader, root, on_record=None):
+    """Обходит дерево владения: каждое юрлицо раскрывается сразу, как только разобрана выписка родителя.
+
+    on_record(record) вызывается для каждого найденного физлица и нового юрлица
+    с глубиной (depth) и ИНН компании, в выписке которой оно найдено (parent_inn).
+    Возвращает (владельцы, нераскрытые ИНН): если бюджет обхода исчерпан,
+    во втором списке перечислены компании, до которых обход не дошёл.
+    """
+    emit = on_record or (lambda record: None)
+    # Корневую компанию не запрашиваем повторно, когда она встретится в своей же выписке
+    visited_inn = {root}
+    unexpanded = []
+
+    def skip(inn, depth, reason):
+        logger.info("ИНН %s не раскрыт: %s (глубина %d)", inn, reason, depth)
+        unexpanded.append({"ИНН": inn, "depth": depth, "reason": reason})
+
+    async def expand(inn, level):
+        try:
+            persons, companies = await loader.load(inn, level)
+        except (BudgetExhausted, ExtractUnavailable) as e:
+            # Поддерево не пропадает молча: ИНН уходит в unexpanded, результат помечается partial
+            skip(inn, level, e.reason)
+            return []
+        owners = []
+        for person in persons:
+            owners.append(person)
+            emit({"type": "person", **person, "depth": level, "parent_inn": inn})
+
+        children = []
+        for company in companies:
+            child_inn = company["ИНН"]
+            if child_inn and child_inn not in visited_inn:
+                visited_inn.add(child_inn)
+                emit({"type": "company", **company, "depth": level, "parent_inn": inn})
+                if not loader.budget.allows_depth(level + 1):
+                    skip(child_inn, level + 1, "max_depth")
+                    continue
+                logger.debug("Запрашиваем выписку по ИНН %s (%s)", child_inn, company["Наименование"])
+                children.append(child_inn)
             else:
-                print(f"{'  '*level}↪️ Пропускаем ИНН {inn} (уже обработан)")
-        i += 1
+                logger.debug("Пропускаем ИНН %s (уже обработан)", child_inn)
+
+        # Порядок результата не зависит от того, какая выписка пришла раньше
+        for child_owners in await asyncio.gather(*(expand(child_inn, level + 1) for child_inn in children)):
+            owners.extend(child_owners)
+        return owners
+
+    owners = await expand(root, 0)
+    return owners, unexpanded
+
+def owners_report(owners, unexpanded):
+    return {"owners": owners, "partial": bool(unexpanded), "unexpanded": unexpanded}
 
-    print(f"{'  '*level}✅ Найдено физических лиц на этом уровне: {len(owners)}")
-    return owners
+async def get_owners(bin: str, budget: TraversalBudget = None) -> List[Dict]:
+    return (await get_owners_report(bin, budget))["owners"]
 
-def get_owners(bin: str) -> List[Dict]:
-    pdf = get_pdf_by_inn_or_name(bin)
-    owners = extract_owners_from_pdf(pdf)
-    return owners 
\ No newline at end of file
+async def get_owners_report(bin: str, budget: TraversalBudget = None) -> Dict:
+    async with httpx.AsyncClient(timeout=30) as client:
+        loader = OwnerLoader(client, budget)
+        report = owners_report(*await traverse_owners(loader, bin))
+    return {**report, "stats": loader.summary()}
+
+async def get_owners_batch(bins: List[str], max_depth=None, max_fetches=None, timeout=None) -> Dict:
+    """Обходы по многим ИНН с общей очередью загрузок: пересекающиеся цепочки загружаются один раз."""
+    roots = list(dict.fromkeys(b.strip() for b in bins if b and b.strip()))
+    budget = TraversalBudget(
+        max_depth,
+        BATCH_MAX_FETCHES if max_fetches is None else max_fetches,
+        BATCH_TIMEOUT if timeout is None else timeout,
+    )
+    async with httpx.AsyncClient(timeout=30) as client:
+        loader = OwnerLoader(client, budget)
+        results = await asyncio.gather(*(traverse_owners(loader, root) for root in roots))
+    reports = {root: owners_report(*result) for root, result in zip(roots, results)}
+    return {
+        "results": reports,
+        "partial": any(report["partial"] for report in reports.values()),
+        "stats": {"roots": len(roots), **loader.summary()},
+    }
+
+async def stream_owners(bin: str, budget: TraversalBudget = None):
+    """Асинхронный генератор записей по мере обхода; последняя запись — итоговая сводка."""
+    queue = asyncio.Queue()
+    started = time.monotonic()
+
+    async def run():
+        try:
+            async with httpx.AsyncClient(timeout=30) as client:
+                loader = OwnerLoader(client, budget)
+                owners, unexpanded = await traverse_owners(loader, bin, queue.put_nowait)
+            queue.put_nowait({
+                "type": "summary",
+                "bin": bin,
+                "persons": len(owners),
+                "partial": bool(unexpanded),
+                "unexpanded": unexpanded,
+                "elapsed_sec": round(time.monotonic() - started, 3),
+                "stats": loader.summary(),
+            })
+        except Exception as e:
+            queue.put_nowait({"type": "error", "bin": bin, "error": str(e)})
+        finally:
+            queue.put_nowait(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            record = await queue.get()
+            if record is None:
+                break
+            yield record
+    finally:
+        # Клиент отключился — обход больше никому не нужен
+        task.cancel()
@@ -0,0 +1,147 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+# --- Настройки (через переменные окружения) ---
+CACHE_DIR = os.getenv("EGRUL_CACHE_DIR", ".egrul_cache")
+CACHE_TTL = float(os.getenv("EGRUL_CACHE_TTL", str(24 * 60 * 60)))  # 0 — кэш выключен
+CACHE_MAX_BYTES = int(float(os.getenv("EGRUL_CACHE_MAX_MB", "500")) * 1024 * 1024)
+
+
+class ExtractCache:
+    """Локальный кэш выписок ЕГРЮЛ по ИНН.
+
+    PDF лежат файлами в каталоге кэша, а индекс (время загрузки, размер,
+    разобранные записи о владельцах) — в SQLite рядом с ними. Записи старше
+    ttl считаются отсутствующими; при превышении max_bytes удаляются выписки,
+    к которым дольше всего не обращались.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, ttl: float = CACHE_TTL, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), check_same_thread=False)
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS extracts (
+                    inn TEXT PRIMARY KEY,
+                    pdf_file TEXT NOT NULL,
+                    pdf_size INTEGER NOT NULL,
+                    parsed TEXT,
+                    parser_version INTEGER,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self._db.commit()
+        return self._db
+
+    def _pdf_path(self, inn: str) -> str:
+        safe = "".join(ch if ch.isalnum() else "_" for ch in inn)
+        return os.path.join(self.directory, f"{safe}.pdf")
+
+    def get(self, inn: str) -> Optional[dict]:
+        """Возвращает {"pdf_path": str, "parsed": ..., "parser_version": int} или None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT pdf_file, parsed, parser_version, fetched_at FROM extracts WHERE inn = ?", (inn,)
+            ).fetchone()
+            if row is None:
+                return None
+            pdf_file, parsed, parser_version, fetched_at = row
+            if time.time() - fetched_at > self.ttl or not os.path.exists(pdf_file):
+                self._delete(db, inn, pdf_file)
+                db.commit()
+                return None
+            db.execute("UPDATE extracts SET accessed_at = ? WHERE inn = ?", (time.time(), inn))
+            db.commit()
+        # Файл не читаем: разбор откроет его по пути
+        return {
+            "pdf_path": pdf_file,
+            "parsed": json.loads(parsed) if parsed is not None else None,
+            "parser_version": parser_version,
+        }
+
+    def put_pdf(self, inn: str, pdf: bytes) -> Optional[str]:
+        """Сохраняет выписку и возвращает путь к файлу (None, если кэш выключен)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            db = self._connect()
+            path = self._pdf_path(inn)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pdf)
+            os.replace(tmp_path, path)
+            now = time.time()
+            db.execute(
+                "INSERT OR REPLACE INTO extracts (inn, pdf_file, pdf_size, parsed, parser_version, fetched_at, accessed_at)"
+                " VALUES (?, ?, ?, NULL, NULL, ?, ?)",
+                (inn, path, len(pdf), now, now),
+            )
+            self._evict(db)
+            db.commit()
+        return path
+
+    def put_parsed(self, inn: str, parsed, parser_version: int):
+        if not self.enabled:
+            return
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "UPDATE extracts SET parsed = ?, parser_version = ? WHERE inn = ?",
+                (json.dumps(parsed, ensure_ascii=False), parser_version, inn),
+            )
+            db.commit()
+
+    def clear(self):
+        with self._lock:
+            db = self._connect()
+            for inn, pdf_file in db.execute("SELECT inn, pdf_file FROM extracts").fetchall():
+                self._delete(db, inn, pdf_file)
+            db.commit()
+
+    def _delete(self, db: sqlite3.Connection, inn: str, pdf_file: str):
+        db.execute("DELETE FROM extracts WHERE inn = ?", (inn,))
+        try:
+            os.remove(pdf_file)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, db: sqlite3.Connection):
+        expired = db.execute(
+            "SELECT inn, pdf_file FROM extracts WHERE fetched_at < ?", (time.time() - self.ttl,)
+        ).fetchall()
+        for inn, pdf_file in expired:
+            self._delete(db, inn, pdf_file)
+
+        total = db.execute("SELECT COALESCE(SUM(pdf_size), 0) FROM extracts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for inn, pdf_file, size in db.execute(
+            "SELECT inn, pdf_file, pdf_size FROM extracts ORDER BY accessed_at"
+        ).fetchall():
+            self._delete(db, inn, pdf_file)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+extract_cache = ExtractCache()
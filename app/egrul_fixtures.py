@@ -0,0 +1,107 @@
+"""Синтетические выписки ЕГРЮЛ для бенчмарков и локальной заглушки ФНС.
+
+Раскладка повторяет реальную выписку: пары «подпись / значение» в одну
+колонку, сведения о записях ГРН между блоками и раздел об участниках.
+"""
+import random
+from typing import List, Tuple
+
+import fitz  # pymupdf
+
+
+FONT = "china-s"  # встроенный шрифт PyMuPDF с кириллицей
+FONT_SIZE = 8
+LINE_HEIGHT = 11
+MARGIN = 40
+
+LAST_NAMES = ["ИВАНОВ", "ПЕТРОВ", "СИДОРОВ", "КУЗНЕЦОВ", "СМИРНОВ", "ПОПОВ", "ВАСИЛЬЕВ", "НОВИКОВ"]
+FIRST_NAMES = ["ИВАН", "ПЕТР", "СЕРГЕЙ", "АЛЕКСЕЙ", "ДМИТРИЙ", "АНДРЕЙ", "ОЛЕГ", "МИХАИЛ"]
+PATRONYMICS = ["ИВАНОВИЧ", "ПЕТРОВИЧ", "СЕРГЕЕВИЧ", "АЛЕКСЕЕВИЧ", "ДМИТРИЕВИЧ", "АНДРЕЕВИЧ"]
+
+
+def random_person(rng: random.Random) -> Tuple[str, str, str]:
+    return rng.choice(LAST_NAMES), rng.choice(FIRST_NAMES), rng.choice(PATRONYMICS)
+
+
+def grn_record(rng: random.Random) -> List[str]:
+    return [
+        "ГРН и дата внесения в ЕГРЮЛ записи, содержащей указанные сведения",
+        f"{rng.randint(10**12, 10**13 - 1)}",
+        f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(2005, 2024)}",
+    ]
+
+
+def extract_lines(name: str, inn: str, persons=(), companies=(), seed: int = 0) -> List[str]:
+    """persons: [(фамилия, имя, отчество, доля)], companies: [(наименование, инн, доля)]."""
+    rng = random.Random(seed or inn)
+    lines = [
+        "ВЫПИСКА",
+        "из Единого государственного реестра юридических лиц",
+        "Наименование",
+        "Сокращенное наименование на русском языке",
+        name,
+        "ИНН",
+        inn,
+        "ОГРН",
+        f"{rng.randint(10**12, 10**13 - 1)}",
+    ]
+    lines += grn_record(rng)
+    lines += ["Адрес юридического лица", "Субъект Российской Федерации", "ГОРОД МОСКВА"]
+    lines += grn_record(rng)
+    lines += ["Сведения о лице, имеющем право без доверенности действовать от имени юридического лица"]
+    director = random_person(rng)
+    lines += ["Фамилия", director[0], "Имя", director[1], "Отчество", director[2], "Должность", "ГЕНЕРАЛЬНЫЙ ДИРЕКТОР"]
+    lines += grn_record(rng)
+
+    lines += ["Сведения об участниках / учредителях юридического лица"]
+    for last, first, middle, share in persons:
+        lines += ["Фамилия", last, "Имя", first, "Отчество", middle]
+        lines += grn_record(rng)
+        lines += ["Номинальная стоимость доли (в рублях)", str(share)]
+        lines += grn_record(rng)
+    for company_name, company_inn, share in companies:
+        lines += ["Полное наименование", company_name]
+        # Иностранные участники идут без ИНН
+        if company_inn:
+            lines += ["ИНН", company_inn]
+        lines += ["Номинальная стоимость доли (в рублях)", str(share)]
+        lines += grn_record(rng)
+
+    lines += ["Сведения о видах экономической деятельности по Общероссийскому классификатору"]
+    for _ in range(rng.randint(5, 15)):
+        lines += [f"{rng.randint(10, 99)}.{rng.randint(10, 99)} Деятельность прочая"]
+        lines += grn_record(rng)
+    return lines
+
+
+def lines_to_pdf(lines: List[str]) -> bytes:
+    doc = fitz.open()
+    page = doc.new_page()
+    y = MARGIN
+    for line in lines:
+        if y > page.rect.height - MARGIN:
+            page = doc.new_page()
+            y = MARGIN
+        page.insert_text((MARGIN, y), line, fontname=FONT, fontsize=FONT_SIZE)
+        y += LINE_HEIGHT
+    pdf = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+    return pdf
+
+
+def make_extract_pdf(name: str, inn: str, persons=(), companies=(), seed: int = 0) -> bytes:
+    return lines_to_pdf(extract_lines(name, inn, persons, companies, seed))
+
+
+def random_inn(rng: random.Random) -> str:
+    return str(rng.randint(10**9, 10**10 - 1))
+
+
+def make_group_extract(rng: random.Random, n_persons: int, n_companies: int, foreign_share: float = 0.0) -> bytes:
+    """Выписка «большой группы» с заданным числом участников (foreign_share — доля участников без ИНН)."""
+    persons = [(*random_person(rng), rng.randint(1, 100) * 1000) for _ in range(n_persons)]
+    companies = [
+        (f'ООО "УЧАСТНИК-{k}"', None if rng.random() < foreign_share else random_inn(rng), rng.randint(1, 100) * 1000)
+        for k in range(n_companies)
+    ]
+    return make_extract_pdf('ООО "ГРУППА"', random_inn(rng), persons, companies, seed=rng.randint(1, 10**6))
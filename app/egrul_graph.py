@@ -0,0 +1,301 @@
+"""Граф владения: компании и люди — вершины, доли участия — рёбра.
+
+Разрешённые подграфы запоминаются по ИНН между запросами: популярная
+материнская компания разбирается один раз, и её поддерево переиспользуется
+всеми группами, которые ей владеют.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from typing import Dict, List, Optional
+
+import httpx
+
+from egrul import BudgetExhausted, ExtractUnavailable, OwnerLoader, TraversalBudget
+from egrul_parser import is_participant
+from metrics import cache_hit
+
+
+MEMO_TTL = float(os.getenv("EGRUL_GRAPH_MEMO_TTL", os.getenv("EGRUL_CACHE_TTL", str(24 * 60 * 60))))
+MEMO_MAX_ENTRIES = int(os.getenv("EGRUL_GRAPH_MEMO_SIZE", "1000"))
+
+logger = logging.getLogger(__name__)
+
+
+def company_id(inn: str) -> str:
+    return f"inn:{inn}"
+
+
+def person_id(fio: str) -> str:
+    # У физлиц в выписке нет ИНН, поэтому человек идентифицируется по ФИО
+    return f"person:{fio}"
+
+
+def parse_share(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Subgraph:
+    """Поддерево владения одной компании.
+
+    complete=False — часть компаний не раскрыта (бюджет или глубина);
+    такие подграфы не запоминаются. depths — глубина каждой компании
+    относительно корня (заполняется у запомненных подграфов).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.nodes: Dict[str, dict] = {}
+        self.edges: Dict[tuple, dict] = {}
+        self.depths: Dict[str, int] = {}
+        self.complete = True
+
+    def height(self) -> int:
+        return max(self.depths.values(), default=0)
+
+    def merge(self, other: "Subgraph"):
+        for node_id, node in other.nodes.items():
+            # Название компании из выписки родителя могло быть неизвестно — не затираем известное
+            if node_id not in self.nodes or not self.nodes[node_id].get("name"):
+                self.nodes[node_id] = node
+        self.edges.update(other.edges)
+        self.complete = self.complete and other.complete
+
+
+class SubgraphMemo:
+    """LRU-память разрешённых подграфов с TTL, общая для всех запросов процесса."""
+
+    def __init__(self, ttl: float = MEMO_TTL, max_entries: int = MEMO_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, inn: str) -> Optional[Subgraph]:
+        with self._lock:
+            item = self._items.get(inn)
+            if item is None:
+                return None
+            stored_at, subgraph = item
+            if time.monotonic() - stored_at > self.ttl:
+                del self._items[inn]
+                return None
+            self._items.move_to_end(inn)
+            return subgraph
+
+    def put(self, inn: str, subgraph: Subgraph):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._items[inn] = (time.monotonic(), subgraph)
+            self._items.move_to_end(inn)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+subgraph_memo = SubgraphMemo()
+
+
+def owners_closure(graph: Subgraph, node_id: str) -> Subgraph:
+    """Подграф владельцев node_id (прямых и косвенных) — то, что запоминается по его ИНН."""
+    incoming = defaultdict(list)
+    for key, edge in graph.edges.items():
+        incoming[edge["to"]].append(key)
+    subgraph = Subgraph(node_id)
+    # Обход в ширину: глубина компании — кратчайший путь от корня, как при обходе по уровням
+    queue, depth = deque([node_id]), {node_id: 0}
+    while queue:
+        current = queue.popleft()
+        node = subgraph.nodes[current] = graph.nodes[current]
+        if node["type"] == "company":
+            subgraph.depths[node["ИНН"]] = depth[current]
+        for key in incoming[current]:
+            subgraph.edges[key] = graph.edges[key]
+            if key[0] not in depth:
+                depth[key[0]] = depth[current] + 1
+                queue.append(key[0])
+    return subgraph
+
+
+async def resolve_subgraph(loader, inn: str, unexpanded: list, name=None) -> Subgraph:
+    """Граф владения компании inn.
+
+    Обход по уровням: каждая компания загружается и разбирается один раз за
+    запрос, на наименьшей глубине, на которой встретилась, — сколько бы путей
+    к ней ни вело. Поддерево из памяти подставляется целиком, только если
+    оно укладывается в max_depth запроса, — иначе компания раскрывается
+    заново, и ответ не зависит от того, что уже есть в памяти.
+    """
+    graph = Subgraph(company_id(inn))
+    levels = {inn: 0}   # ИНН, уже взятые в обход, и их глубина
+    truncated = set()   # нераскрытые компании: бюджет или глубина
+    expanded = []
+
+    def add_company(company_inn, company_name):
+        cid = company_id(company_inn)
+        node = graph.nodes.get(cid)
+        if node is None or not node.get("name"):
+            graph.nodes[cid] = {"id": cid, "type": "company", "ИНН": company_inn, "name": company_name}
+        return cid
+
+    async def expand(company_inn, company_name):
+        level = levels[company_inn]
+        memoized = subgraph_memo.get(company_inn)
+        if memoized is not None and not loader.budget.allows_depth(level + memoized.height()):
+            memoized = None
+        cache_hit("egrul_graph", memoized is not None)
+        if memoized is not None:
+            logger.debug("Подграф ИНН %s взят из памяти", company_inn)
+            for depth_inn, depth in memoized.depths.items():
+                levels.setdefault(depth_inn, level + depth)
+            graph.merge(memoized)
+            return []
+
+        root = add_company(company_inn, company_name)
+        try:
+            persons, companies = await loader.load(company_inn, level)
+        except (BudgetExhausted, ExtractUnavailable) as e:
+            # Компания остаётся в графе листом; поддеревья над ней не запоминаем
+            unexpanded.append({"ИНН": company_inn, "depth": level, "reason": e.reason})
+            truncated.add(company_inn)
+            return []
+        expanded.append(company_inn)
+
+        owners, children = [], []
+        # Рёбра владения — только из раздела участников: руководитель компании ею не владеет
+        for person in filter(is_participant, persons):
+            pid = person_id(person["ФИО"])
+            graph.nodes[pid] = {"id": pid, "type": "person", "name": person["ФИО"]}
+            owners.append((pid, parse_share(person["Доля (руб)"])))
+        for company in companies:
+            child_inn = company["ИНН"]
+            if not child_inn:
+                continue
+            if child_inn == company_inn:
+                # Собственное название компании в её же выписке
+                graph.nodes[root]["name"] = graph.nodes[root]["name"] or company["Наименование"]
+                continue
+            if not is_participant(company):
+                continue
+            owners.append((add_company(child_inn, company["Наименование"]), parse_share(company.get("Доля (руб)"))))
+            if child_inn in levels:
+                continue
+            if not loader.budget.allows_depth(level + 1):
+                unexpanded.append({"ИНН": child_inn, "depth": level + 1, "reason": "max_depth"})
+                truncated.add(child_inn)
+                continue
+            levels[child_inn] = level + 1
+            children.append((child_inn, company["Наименование"]))
+
+        # Доля в процентах от суммы известных номинальных стоимостей долей участников
+        total = sum(share for _, share in owners if share)
+        for owner, share in owners:
+            graph.edges[(owner, root)] = {
+                "from": owner,
+                "to": root,
+                "share_rub": share,
+                "share": share / total if share and total else None,
+            }
+        return children
+
+    frontier = [(inn, name)]
+    while frontier:
+        results = await asyncio.gather(*(expand(company_inn, company_name) for company_inn, company_name in frontier))
+        frontier = [child for children in results for child in children]
+
+    # Поддерево полное, если среди его владельцев нет нераскрытых компаний
+    owned = defaultdict(list)
+    for owner, company in graph.edges:
+        owned[owner].append(company)
+    incomplete = {company_id(company_inn) for company_inn in truncated}
+    stack = list(incomplete)
+    while stack:
+        for company in owned[stack.pop()]:
+            if company not in incomplete:
+                incomplete.add(company)
+                stack.append(company)
+    for company_inn in expanded:
+        if company_id(company_inn) not in incomplete:
+            subgraph_memo.put(company_inn, owners_closure(graph, company_id(company_inn)))
+    graph.complete = graph.root not in incomplete
+    return graph
+
+
+def effective_shares(graph: Subgraph) -> Dict[str, float]:
+    """Сквозная доля каждого владельца в корневой компании (сумма произведений долей по путям).
+
+    Считается одним проходом в топологическом порядке (компания раньше своих
+    владельцев), без перебора путей. Рёбра, замыкающие цикл перекрёстного
+    владения, не учитываются.
+    """
+    incoming = defaultdict(list)
+    for edge in graph.edges.values():
+        if edge["share"] is not None:
+            incoming[edge["to"]].append((edge["from"], edge["share"]))
+
+    # Обратный post-order обхода в глубину от корня по направлению к владельцам
+    order, back_edges = [], set()
+    state = {graph.root: "open"}
+    stack = [(graph.root, iter(incoming[graph.root]))]
+    while stack:
+        node_id, owners = stack[-1]
+        for owner, _ in owners:
+            if state.get(owner) == "open":
+                back_edges.add((owner, node_id))
+            elif owner not in state:
+                state[owner] = "open"
+                stack.append((owner, iter(incoming[owner])))
+                break
+        else:
+            state[node_id] = "done"
+            order.append(node_id)
+            stack.pop()
+
+    weights = defaultdict(float, {graph.root: 1.0})
+    for node_id in reversed(order):
+        for owner, share in incoming[node_id]:
+            if (owner, node_id) not in back_edges:
+                weights[owner] += weights[node_id] * share
+    weights.pop(graph.root)
+    return dict(weights)
+
+
+def graph_to_dict(graph: Subgraph) -> dict:
+    shares = effective_shares(graph)
+    nodes: List[dict] = []
+    for node_id, node in graph.nodes.items():
+        share = shares.get(node_id)
+        nodes.append({**node, "effective_share": round(share, 6) if share is not None else None})
+    return {
+        "root": graph.root,
+        "nodes": nodes,
+        "edges": list(graph.edges.values()),
+        "beneficiaries": sorted(
+            ({"id": n["id"], "name": n["name"], "effective_share": n["effective_share"]}
+             for n in nodes if n["type"] == "person" and n["effective_share"]),
+            key=lambda n: -n["effective_share"],
+        ),
+    }
+
+
+async def get_ownership_graph(bin: str, budget: TraversalBudget = None) -> dict:
+    unexpanded = []
+    async with httpx.AsyncClient(timeout=30) as client:
+        loader = OwnerLoader(client, budget)
+        graph = await resolve_subgraph(loader, bin, unexpanded)
+    return {
+        **graph_to_dict(graph),
+        "partial": bool(unexpanded),
+        "unexpanded": unexpanded,
+        "stats": loader.summary(),
+    }
@@ -0,0 +1,141 @@
+import logging
+import re
+from bisect import bisect_left
+from typing import List, Tuple
+
+import fitz  # pymupdf
+
+
+logger = logging.getLogger(__name__)
+
+# Версия разбора выписки: при изменении парсера закэшированные записи разбираются заново
+PARSER_VERSION = 4
+
+# Сколько строк вверх/вниз от названия юрлица ищем ИНН и долю
+LOOKAHEAD = 30
+
+INN_INLINE_RE = re.compile(r'ИНН.*?(\d{10,12})')
+INN_RE = re.compile(r'\d{10,12}')
+NUMBER_RE = re.compile(r'\d+')
+ORG_RE = re.compile(r'\b(ООО|АО|ПАО)\b')
+SECTION_RE = re.compile(r'^Сведения\s+(об?|о)\s', re.IGNORECASE)
+# Раздел с участниками (учредителями): только записи из него — владельцы долей
+PARTICIPANTS_RE = re.compile(r'участник|учредител', re.IGNORECASE)
+SHARE_LABEL = "Номинальная стоимость доли"
+
+
+def open_pdf(source):
+    """PDF из байтов или по пути: файл MuPDF читает с диска по мере надобности, без копии в памяти."""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    try:
+        return fitz.open(source, filetype="pdf")
+    except fitz.FileNotFoundError as e:
+        raise FileNotFoundError(source) from e
+
+
+def pdf_to_lines(source) -> List[str]:
+    """Строки выписки по текстовым блокам PyMuPDF (режим "blocks" заметно дешевле "dict")."""
+    lines = []
+    with open_pdf(source) as doc:
+        for page in doc:
+            for block in page.get_text("blocks"):
+                if block[6] == 0:  # 0 — текстовый блок, 1 — изображение
+                    lines.extend(line.strip() for line in block[4].splitlines())
+    return lines
+
+
+class LineIndex:
+    """Позиции ИНН, долей и заголовков разделов, собранные за один проход по строкам."""
+
+    def __init__(self, lines: List[str]):
+        self.inn_pos, self.inn_values = [], []
+        self.share_pos, self.share_values = [], []
+        self.section_pos, self.section_titles = [], []
+
+        last = len(lines) - 1
+        for j, line in enumerate(lines):
+            match = INN_INLINE_RE.search(line)
+            if match:
+                self._add(self.inn_pos, self.inn_values, j, match.group(1))
+            elif j < last and line.upper() == "ИНН":
+                match = INN_RE.search(lines[j + 1])
+                if match:
+                    self._add(self.inn_pos, self.inn_values, j, match.group())
+
+            if j < last and SHARE_LABEL in line:
+                match = NUMBER_RE.search(lines[j + 1])
+                if match:
+                    self._add(self.share_pos, self.share_values, j, match.group())
+
+            if SECTION_RE.match(line):
+                self._add(self.section_pos, self.section_titles, j, line)
+
+    @staticmethod
+    def _add(positions, values, j, value):
+        positions.append(j)
+        values.append(value)
+
+    def inn_near(self, index: int, lookahead: int = LOOKAHEAD):
+        """Ближайший ИНН: сначала вниз (включая строку index), затем вверх."""
+        k = bisect_left(self.inn_pos, index)
+        if k < len(self.inn_pos) and self.inn_pos[k] < index + lookahead:
+            return self.inn_values[k]
+        if k > 0 and self.inn_pos[k - 1] > index - lookahead:
+            return self.inn_values[k - 1]
+        return None
+
+    def share_after(self, index: int, lookahead: int = LOOKAHEAD):
+        # Не дальше начала следующего раздела: у руководителя нет доли, и чужую ему не приписываем
+        k = bisect_left(self.share_pos, index)
+        if k < len(self.share_pos) and self.share_pos[k] < min(index + lookahead, self.next_section(index)):
+            return self.share_values[k]
+        return None
+
+    def next_section(self, index: int):
+        k = bisect_left(self.section_pos, index + 1)
+        return self.section_pos[k] if k < len(self.section_pos) else float("inf")
+
+    def section_of(self, index: int):
+        k = bisect_left(self.section_pos, index + 1)
+        return self.section_titles[k - 1] if k > 0 else None
+
+
+def parse_lines(lines: List[str], level=0) -> Tuple[List[dict], List[dict]]:
+    """Разбирает строки одной выписки без рекурсии: физлица и найденные юрлица с ИНН."""
+    persons = []
+    companies = []
+    index = LineIndex(lines)
+
+    i = 0
+    while i < len(lines):
+        # 1. Физическое лицо
+        if lines[i].upper() == "ФАМИЛИЯ" and i + 5 < len(lines):
+            fio = f"{lines[i+1]} {lines[i+3]} {lines[i+5]}"
+            share = index.share_after(i)
+            persons.append({"ФИО": fio, "ИНН": None, "Доля (руб)": share, "Раздел": index.section_of(i)})
+            logger.debug("Найдено физлицо: %s, доля: %s", fio, share)
+            i += 6
+            continue
+
+        # 2. Юрлицо — ищем по словам "ООО", "АО", "ПАО"
+        if ORG_RE.search(lines[i]):
+            org_name = lines[i]
+            inn = index.inn_near(i)
+            share = index.share_after(i)
+            logger.debug("Найдено юрлицо: %s, ИНН: %s, доля: %s", org_name, inn, share)
+            companies.append({"Наименование": org_name, "ИНН": inn, "Доля (руб)": share, "Раздел": index.section_of(i)})
+        i += 1
+
+    logger.debug("Уровень %d: физлиц %d, юрлиц %d", level, len(persons), len(companies))
+    return persons, companies
+
+
+def is_participant(record: dict) -> bool:
+    """Запись из раздела об участниках / учредителях (а не руководитель, держатель реестра и т. п.)."""
+    return bool(record.get("Раздел")) and bool(PARTICIPANTS_RE.search(record["Раздел"]))
+
+
+def parse_owners(source, level=0) -> Tuple[List[dict], List[dict]]:
+    """source — путь к PDF или его байты."""
+    return parse_lines(pdf_to_lines(source), level)
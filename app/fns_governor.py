@@ -0,0 +1,184 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from metrics import EGRUL_HTTP_IN_FLIGHT, EGRUL_HTTP_SECONDS
+
+
+# --- Настройки (через переменные окружения) ---
+RATE_PER_SEC = float(os.getenv("EGRUL_RATE_PER_SEC", "5"))
+BURST = int(os.getenv("EGRUL_BURST", "10"))
+MAX_RETRIES = int(os.getenv("EGRUL_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("EGRUL_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("EGRUL_RETRY_MAX_DELAY", "10"))
+POLL_INITIAL_DELAY = float(os.getenv("EGRUL_POLL_INITIAL_DELAY", "0.25"))
+POLL_MAX_DELAY = float(os.getenv("EGRUL_POLL_MAX_DELAY", "3"))
+POLL_BACKOFF = float(os.getenv("EGRUL_POLL_BACKOFF", "1.5"))
+LOOKUP_TIMEOUT = float(os.getenv("EGRUL_LOOKUP_TIMEOUT", "60"))
+
+
+class LookupTimeout(Exception):
+    """Истёк дедлайн одного запроса выписки."""
+
+
+class TokenBucket:
+    """Токен-бакет на весь процесс.
+
+    Состояние защищено обычным threading.Lock, поэтому бакет можно делить
+    между потоками и разными циклами событий: токен резервируется сразу,
+    а ожидание до его появления делает уже вызывающий код.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает, сколько секунд нужно подождать до его появления."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self):
+        """Возвращает зарезервированный токен, если ждать его не стали."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class GovernorStats:
+    """Счётчики: сколько времени ушло на ожидание, а сколько — на сами запросы."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.retries = 0
+            self.throttled = 0
+            self.timeouts = 0
+            self.work_seconds = 0.0
+            self.rate_limit_wait_seconds = 0.0
+            self.retry_wait_seconds = 0.0
+            self.poll_wait_seconds = 0.0
+
+    def add(self, **values):
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            wait = self.rate_limit_wait_seconds + self.retry_wait_seconds + self.poll_wait_seconds
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "timeouts": self.timeouts,
+                "work_seconds": round(self.work_seconds, 3),
+                "wait_seconds": round(wait, 3),
+                "rate_limit_wait_seconds": round(self.rate_limit_wait_seconds, 3),
+                "retry_wait_seconds": round(self.retry_wait_seconds, 3),
+                "poll_wait_seconds": round(self.poll_wait_seconds, 3),
+            }
+
+
+def make_deadline(timeout: float = None) -> float:
+    return time.monotonic() + (LOOKUP_TIMEOUT if timeout is None else timeout)
+
+
+def remaining(deadline: float) -> float:
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise LookupTimeout("Истёк дедлайн запроса к ФНС")
+    return left
+
+
+class RequestGovernor:
+    """Единая точка для всех HTTP-запросов к ФНС: лимит, ретраи, поллинг, дедлайн."""
+
+    def __init__(self, bucket: TokenBucket, stats: GovernorStats, max_retries: int = MAX_RETRIES):
+        self.bucket = bucket
+        self.stats = stats
+        self.max_retries = max_retries
+
+    async def sleep(self, delay: float, deadline: float, kind: str):
+        # Не спим дольше дедлайна: лучше сразу сообщить о таймауте
+        if delay >= remaining(deadline):
+            self.stats.add(timeouts=1)
+            raise LookupTimeout("Истёк дедлайн запроса к ФНС")
+        await asyncio.sleep(delay)
+        self.stats.add(**{f"{kind}_wait_seconds": delay})
+
+    def retry_delay(self, attempt: int, response: httpx.Response = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), RETRY_MAX_DELAY)
+        # Экспоненциальная задержка с "полным" джиттером
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, deadline: float, hop: str = "other", **kwargs) -> httpx.Response:
+        for attempt in range(self.max_retries + 1):
+            await self.sleep_for_token(deadline)
+            started = time.monotonic()
+            try:
+                with EGRUL_HTTP_IN_FLIGHT.track_inprogress():
+                    response = await client.request(method, url, timeout=remaining(deadline), **kwargs)
+            except httpx.TransportError:
+                EGRUL_HTTP_SECONDS.labels(hop, "error").observe(time.monotonic() - started)
+                self.stats.add(requests=1, work_seconds=time.monotonic() - started)
+                if attempt == self.max_retries:
+                    raise
+                self.stats.add(retries=1)
+                await self.sleep(self.retry_delay(attempt), deadline, "retry")
+                continue
+            EGRUL_HTTP_SECONDS.labels(hop, str(response.status_code)).observe(time.monotonic() - started)
+            self.stats.add(requests=1, work_seconds=time.monotonic() - started)
+
+            if response.status_code == 429 or response.status_code >= 500:
+                if response.status_code == 429:
+                    self.stats.add(throttled=1)
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                self.stats.add(retries=1)
+                await self.sleep(self.retry_delay(attempt, response), deadline, "retry")
+                continue
+
+            response.raise_for_status()
+            return response
+
+    async def sleep_for_token(self, deadline: float):
+        delay = self.bucket.reserve()
+        if delay > 0:
+            try:
+                await self.sleep(delay, deadline, "rate_limit")
+            except BaseException:
+                # Запрос не состоится (дедлайн, отмена) — его место в очереди отдаём другим
+                self.bucket.refund()
+                raise
+
+    async def poll(self, check, deadline: float):
+        """Вызывает check() с растущей паузой, пока он не вернёт что-то кроме None."""
+        delay = POLL_INITIAL_DELAY
+        while True:
+            result = await check()
+            if result is not None:
+                return result
+            await self.sleep(delay, deadline, "poll")
+            delay = min(delay * POLL_BACKOFF, POLL_MAX_DELAY)
+
+
+stats = GovernorStats()
+governor = RequestGovernor(TokenBucket(RATE_PER_SEC, BURST), stats)
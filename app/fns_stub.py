@@ -0,0 +1,168 @@
+"""Локальная заглушка egrul.nalog.ru для нагрузочных тестов egrul.py.
+
+Повторяет цепочку POST / → /search-result/ → /vyp-request/ → /vyp-download/
+и отдаёт сгенерированные выписки, которые складываются в синтетическое
+дерево владения заданной глубины и ветвистости. Задержка ответа, число
+ответов "wait" при поллинге, троттлинг (429) и доля ошибок 5xx настраиваются.
+
+    STUB_DEPTH=3 STUB_FANOUT=4 uvicorn fns_stub:app --port 8081
+    EGRUL_BASE_URL=http://localhost:8081 uvicorn main:app
+"""
+import asyncio
+import hashlib
+import itertools
+import os
+import random
+import threading
+import time
+from functools import lru_cache
+
+from fastapi import FastAPI, Form, HTTPException
+from fastapi.responses import JSONResponse, Response
+
+from egrul_fixtures import make_extract_pdf, random_person
+
+
+class StubConfig:
+    def __init__(self, **overrides):
+        self.depth = int(os.getenv("STUB_DEPTH", "3"))              # глубина дерева владения
+        self.fanout = int(os.getenv("STUB_FANOUT", "3"))            # юрлиц-участников у компании
+        self.persons = int(os.getenv("STUB_PERSONS", "2"))          # физлиц-участников у компании
+        self.shared = float(os.getenv("STUB_SHARED", "0.3"))        # доля участников из общего пула (пересечения цепочек)
+        self.latency_ms = float(os.getenv("STUB_LATENCY_MS", "50"))  # задержка каждого ответа
+        self.jitter_ms = float(os.getenv("STUB_JITTER_MS", "20"))
+        self.poll_waits = int(os.getenv("STUB_POLL_WAITS", "2"))    # сколько раз поиск отвечает "wait"
+        self.rate_limit = float(os.getenv("STUB_RATE_LIMIT", "0"))  # запросов/с до ответа 429; 0 — без лимита
+        self.error_rate = float(os.getenv("STUB_ERROR_RATE", "0"))  # доля случайных 503
+        self.seed = int(os.getenv("STUB_SEED", "1"))
+        for name, value in overrides.items():
+            setattr(self, name, value)
+
+
+config = StubConfig()
+app = FastAPI(title="FNS stub")
+
+_lock = threading.Lock()
+_tokens = {}
+_token_ids = itertools.count(1)
+_counters = {"search": 0, "poll": 0, "vyp_request": 0, "download": 0, "throttled": 0, "errors": 0}
+_window = {"started": time.monotonic(), "count": 0}
+_depths = {}  # глубина компании в дереве, известна после генерации выписки родителя
+
+
+def configure(**overrides):
+    """Перенастраивает заглушку (используется бенчмарком, который поднимает её в своём процессе)."""
+    global config
+    config = StubConfig(**overrides)
+    company_children.cache_clear()
+    extract_pdf.cache_clear()
+    _depths.clear()
+    with _lock:
+        _tokens.clear()
+        for name in _counters:
+            _counters[name] = 0
+
+
+def _derive_inn(*parts) -> str:
+    digest = hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()
+    return str(10**9 + int(digest[:15], 16) % (9 * 10**9))
+
+
+@lru_cache(maxsize=None)
+def company_children(inn: str, depth: int):
+    """Участники компании: [(инн, доля)] юрлиц и [(ФИО..., доля)] физлиц. Дерево детерминировано по ИНН."""
+    rng = random.Random(f"{config.seed}:{inn}")
+    persons = [(*random_person(rng), rng.randint(1, 100) * 1000) for _ in range(config.persons)]
+    companies = []
+    if depth < config.depth:
+        for k in range(config.fanout):
+            if rng.random() < config.shared:
+                # Общий пул уровня: одни и те же компании попадают в цепочки разных корней
+                child = _derive_inn("shared", config.seed, depth + 1, rng.randrange(config.fanout * 2))
+            else:
+                child = _derive_inn(config.seed, inn, k)
+            companies.append((child, rng.randint(1, 100) * 1000))
+    return persons, companies
+
+
+@lru_cache(maxsize=4096)
+def extract_pdf(inn: str) -> bytes:
+    depth = _depths.get(inn, 0)
+    persons, companies = company_children(inn, depth)
+    for child, _ in companies:
+        _depths.setdefault(child, depth + 1)
+    return make_extract_pdf(
+        f'ООО "КОМПАНИЯ-{inn}"',
+        inn,
+        persons,
+        [(f'ООО "КОМПАНИЯ-{child}"', child, share) for child, share in companies],
+    )
+
+
+async def _simulate(kind: str):
+    with _lock:
+        _counters[kind] += 1
+        if config.rate_limit > 0:
+            now = time.monotonic()
+            if now - _window["started"] >= 1:
+                _window["started"], _window["count"] = now, 0
+            _window["count"] += 1
+            if _window["count"] > config.rate_limit:
+                _counters["throttled"] += 1
+                raise HTTPException(429, "Too Many Requests", headers={"Retry-After": "1"})
+        if config.error_rate and random.random() < config.error_rate:
+            _counters["errors"] += 1
+            raise HTTPException(503, "Service Unavailable")
+    delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+
+def _new_token(**state) -> str:
+    token = f"t{next(_token_ids)}"
+    with _lock:
+        _tokens[token] = state
+    return token
+
+
+def _token(t: str) -> dict:
+    with _lock:
+        state = _tokens.get(t)
+    if state is None:
+        raise HTTPException(404, "unknown token")
+    return state
+
+
+@app.post("/")
+async def search(query: str = Form(...)):
+    await _simulate("search")
+    return {"t": _new_token(inn=query.strip(), polls=0)}
+
+
+@app.get("/search-result/{t}")
+async def search_result(t: str):
+    await _simulate("poll")
+    state = _token(t)
+    state["polls"] += 1
+    if state["polls"] <= config.poll_waits:
+        return {"status": "wait"}
+    return {"rows": [{"t": _new_token(inn=state["inn"])}]}
+
+
+@app.get("/vyp-request/{t}")
+async def vyp_request(t: str):
+    await _simulate("vyp_request")
+    return {"t": _new_token(inn=_token(t)["inn"])}
+
+
+@app.get("/vyp-download/{t}")
+async def vyp_download(t: str):
+    await _simulate("download")
+    pdf = await asyncio.to_thread(extract_pdf, _token(t)["inn"])
+    return Response(pdf, media_type="application/pdf")
+
+
+@app.get("/stub/stats")
+def stub_stats():
+    with _lock:
+        return JSONResponse({**_counters, "companies_known": len(_depths)})
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+from ollama_pool import get_pool
+
+
+MODEL = os.getenv("OLLAMA_MODEL", "llama3:70b-instruct-q2_K")
+# ollama — настоящая модель, fake — детерминированная заглушка для бенчмарков
+LLM_BACKEND = os.getenv("LLM_BACKEND", "ollama")
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+
+
+class FakeContractLLM(LLM):
+    """Детерминированная LLM-заглушка: ответ зависит только от текста промпта.
+
+    На промпт проверки правила отвечает {"violation": false}, на промпт
+    извлечения реквизитов — JSON с полями договора. Задержка ответа
+    имитирует время генерации.
+    """
+
+    latency_ms: float = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-contract"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return fake_answer(prompt)
+
+
+def fake_answer(prompt: str) -> str:
+    """Ответ заглушки на промпт (общий для FakeContractLLM и ollama_stub)."""
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    if "ID правила" in prompt:
+        return json.dumps({"violation": False})
+    return json.dumps({
+        "contractNumber": f"{int(digest[:6], 16) % 1000}/{int(digest[6:8], 16)}",
+        "contractDate": "2024-01-15",
+        "buyer": "ТОО «Покупатель»",
+        "seller": "ООО «Поставщик»",
+        "operationType": "import",
+        "contractAmount": int(digest[8:14], 16) % 10_000_000,
+        "currency": "USD",
+        "repatriationTerm": None,
+        "counterpartyName": None,
+        "counterpartyCountry": "RU",
+        "counterpartyBank": None,
+        "buyerInn": None,
+        "sellerInn": None,
+    }, ensure_ascii=False)
+
+
+class PooledOllamaLLM(LLM):
+    """LLM поверх пула серверов Ollama (ollama_pool): хост выбирается на каждый вызов."""
+
+    model: str
+    options: dict = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "ollama-pool"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model": self.model, "options": self.options}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> str:
+        return get_pool().generate(self.model, prompt, {**self.options, **kwargs}, stop)
+
+
+def model_id() -> str:
+    """Имя модели, которая отвечает на самом деле (ключ для кэшей ответов)."""
+    return "fake" if LLM_BACKEND == "fake" else MODEL
+
+
+def make_llm(**options) -> LLM:
+    """LLM для цепочек; options — параметры генерации Ollama (num_ctx, temperature, ...)."""
+    if LLM_BACKEND == "fake":
+        return FakeContractLLM(latency_ms=FAKE_LLM_LATENCY_MS)
+    return PooledOllamaLLM(model=MODEL, options=options)
@@ -1,12 +1,119 @@
 
-from fastapi import FastAPI, Body
+from fastapi import APIRouter, FastAPI, Body
 from pydantic import BaseModel
-from processor import process_pdf, process_text, read_pdf
-from compliance import compliance_validation
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from egrul import get_owners 
+from typing import List, Optional
+import asyncio
+import json
+import os
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Response
+from fastapi.responses import StreamingResponse
+from starlette.routing import Match
+import time
+import metrics
+import tracing
+from admission import admitted, request_priority
+from singleflight import SingleFlight, content_key
+from uploads import file_digest, limit_upload_size, link_upload, spooled_upload
+
+# Какие группы эндпоинтов обслуживает процесс: ocr, extraction, compliance, egrul.
+# Модули ролей импортируются только для включённых ролей, поэтому, например,
+# реплика с APP_ROLES=egrul не загружает torch, transformers и LangChain.
+ALL_ROLES = ("ocr", "extraction", "compliance", "egrul")
+APP_ROLES = os.getenv("APP_ROLES", ",".join(ALL_ROLES))
+
+
+def route_path(request):
+    # Шаблон маршрута вместо фактического пути — чтобы не плодить метки
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+async def count_requests(request, call_next):
+    endpoint = route_path(request)
+    if endpoint == "/metrics":
+        return await call_next(request)
+    started = time.perf_counter()
+    with metrics.REQUESTS_IN_FLIGHT.labels(endpoint).track_inprogress():
+        try:
+            response = await call_next(request)
+        except Exception:
+            metrics.REQUESTS.labels(endpoint, "exception").inc()
+            raise
+    metrics.REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+    metrics.REQUESTS.labels(endpoint, metrics.outcome(response.status_code)).inc()
+    return response
+
+
+async def trace_requests(request, call_next):
+    endpoint = route_path(request)
+    if endpoint == "/metrics" or endpoint.startswith("/traces/"):
+        return await call_next(request)
+    with tracing.start_trace(f"{request.method} {endpoint}", request.headers.get("X-Request-ID")) as trace:
+        try:
+            response = await call_next(request)
+        except Exception:
+            trace.finish(500)
+            raise
+    trace.finish(response.status_code)
+    response.headers["X-Request-ID"] = trace.request_id
+    return response
+
+
+async def admitted_call(endpoint, priority, llm, fn, *args):
+    async with admitted(endpoint, priority, llm):
+        # Тяжёлая синхронная работа — в пуле потоков, чтобы не блокировать цикл событий
+        return await asyncio.to_thread(fn, *args)
+
+
+async def run_once(flights, key, work):
+    """Одинаковые одновременные запросы выполняются один раз: в очередь допуска и в работу идёт только первый."""
+    return await flights.do(key, work)
+
+
+async def run_once_on_file(flights, key, pdf_path, work):
+    """run_once для загруженного файла: work(path) читает свою ссылку на файл, ссылка удаляется после работы."""
+    def start():
+        # Ссылка создаётся сразу, до первого await: файл первого клиента может исчезнуть в любой момент
+        own_path = link_upload(pdf_path)
+
+        async def run():
+            try:
+                return await work(own_path)
+            finally:
+                os.remove(own_path)
+
+        return run()
+    return await flights.do(key, start)
+
+
+def service_router(roles):
+    router = APIRouter()
+
+    @router.get("/metrics")
+    def prometheus_metrics():
+        body, content_type = metrics.render()
+        return Response(body, media_type=content_type)
+
+    @router.get("/traces/")
+    def recent_traces(limit: int = 50):
+        return tracing.trace_store.recent(limit)
+
+    @router.get("/traces/{request_id}")
+    def request_trace(request_id: str):
+        trace = tracing.trace_store.get(request_id)
+        if trace is None:
+            raise HTTPException(404, "Трасса не найдена (устарела или не было такого запроса)")
+        return trace.to_dict()
+
+    @router.get("/roles/")
+    def served_roles():
+        return roles
+
+    return router
 
-app = FastAPI()
 
 class Document(BaseModel):
     text: str
@@ -14,35 +121,173 @@ class Document(BaseModel):
 class PdfTextRequest(BaseModel):
     file_text: str
 
-@app.post("/process/")
-async def process(file: UploadFile = File(...)):
-    if file.content_type not in ("application/pdf", "application/x-pdf"):
-        raise HTTPException(400, "Нужен PDF-файл")
+class ComplianceRequest(PdfTextRequest):
+    # Идентификатор договора: повторная проверка новой редакции перепроверяет только затронутые правила
+    document_id: Optional[str] = None
+
+class EgrulBatchRequest(BaseModel):
+    bins: List[str]
+    max_depth: Optional[int] = None
+    max_fetches: Optional[int] = None
+    timeout: Optional[float] = None
+
+
+def ocr_router():
+    from ocr import read_pdf
+
+    router = APIRouter()
+    flights = SingleFlight("ocr")
+
+    def read_pdf_with_pages(pdf_path, profile):
+        pages = {}
+        return read_pdf(pdf_path, profile, pages), pages
+
+    @router.post("/ocr/")
+    async def process(file: UploadFile = File(...), profile: Optional[str] = None,
+                      priority: str = Depends(request_priority("batch"))):
+        if file.content_type not in ("application/pdf", "application/x-pdf"):
+            raise HTTPException(400, "Нужен PDF-файл")
+        async with spooled_upload(file) as pdf_path:
+            key = content_key(await asyncio.to_thread(file_digest, pdf_path), profile)
+            text, pages = await run_once_on_file(
+                flights, key, pdf_path, lambda path: admitted_call("ocr", priority, False, read_pdf_with_pages, path, profile))
+        return { 'result' : text, 'pages': pages}
+
+    return router
+
+
+def extraction_router():
+    from ocr import read_pdf
+    from processor import process_text
+
+    router = APIRouter()
+    pdf_flights = SingleFlight("process")
+    text_flights = SingleFlight("process_text")
+
+    @router.post("/process/")
+    async def process(file: UploadFile = File(...), profile: Optional[str] = None,
+                      priority: str = Depends(request_priority("batch"))):
+        if file.content_type not in ("application/pdf", "application/x-pdf"):
+            raise HTTPException(400, "Нужен PDF-файл")
+
+        async def process_upload(path):
+            async with admitted("process", priority):
+                text = await asyncio.to_thread(read_pdf, path, profile)
+                # Общий слот LLM — только на извлечение, OCR идёт под лимитом эндпоинта
+                return await admitted_call(None, priority, True, process_text, text)
+
+        async with spooled_upload(file) as pdf_path:
+            key = content_key(await asyncio.to_thread(file_digest, pdf_path), profile)
+            return await run_once_on_file(pdf_flights, key, pdf_path, process_upload)
+
+    # Интерактивные запросы: в очереди к LLM идут раньше пакетных
+    @router.post("/processText/")
+    async def process(request: PdfTextRequest, priority: str = Depends(request_priority("interactive"))):
+        key = content_key(request.file_text)
+        return await run_once(text_flights, key,
+                              lambda: admitted_call("process_text", priority, True, process_text, request.file_text))
+
+    return router
+
+
+def compliance_router():
+    from compliance import compliance_report, get_classifier, get_contract_type
+
+    router = APIRouter()
+    flights = SingleFlight("compliance")
+
+    @router.post("/compliance/")
+    async def process(request: ComplianceRequest, response: Response,
+                      priority: str = Depends(request_priority("batch"))):
+        async def check():
+            async with admitted("compliance", priority):
+                contract_type = await asyncio.to_thread(get_contract_type, request.file_text)
+                # Классификация (XLM-R) идёт под лимитом эндпоинта, слот LLM — только на проверку правил
+                return await admitted_call(None, priority, True, compliance_report,
+                                           request.file_text, request.document_id, contract_type)
+
+        key = content_key(request.file_text, request.document_id)
+        report = await run_once(flights, key, check)
+        # Формат ответа прежний (список нарушений), сведения о перепроверке — в заголовках
+        if request.document_id:
+            response.headers["X-Compliance-Revision"] = str(report["revision"])
+            response.headers["X-Compliance-Rechecked"] = ",".join(report["rechecked"])
+            response.headers["X-Compliance-Reused"] = ",".join(report["reused"])
+        return report["violations"]
+
+    # Модель классификатора грузим при старте роли, а не на первом запросе
+    router.add_event_handler("startup", get_classifier)
+    return router
+
+
+def egrul_router():
+    from egrul import TraversalBudget, get_owners_batch, get_owners_report, stream_owners
+    from egrul_graph import get_ownership_graph
+    from fns_governor import stats as fns_stats
+
+    router = APIRouter()
+
+    def traversal_budget(max_depth: Optional[int] = None, max_fetches: Optional[int] = None, timeout: Optional[float] = None):
+        # Бюджет обхода из query-параметров; не заданные берутся из переменных окружения
+        return TraversalBudget(max_depth, max_fetches, timeout)
+
+    @router.get("/egrul/")
+    async def process(bin: str, response: Response, budget: TraversalBudget = Depends(traversal_budget)):
+        report = await get_owners_report(bin, budget)
+        # Формат ответа прежний (список владельцев), признак неполноты — в заголовках
+        response.headers["X-Egrul-Partial"] = "true" if report["partial"] else "false"
+        if report["unexpanded"]:
+            response.headers["X-Egrul-Unexpanded"] = ",".join(item["ИНН"] for item in report["unexpanded"])
+        return report["owners"]
+
+    @router.get("/egrul/stream/")
+    async def egrul_stream(bin: str, budget: TraversalBudget = Depends(traversal_budget)):
+        # NDJSON: по записи на строку, как только владелец найден
+        records = (json.dumps(record, ensure_ascii=False) + "\n" async for record in stream_owners(bin, budget))
+        return StreamingResponse(records, media_type="application/x-ndjson")
+
+    @router.post("/egrul/batch/")
+    async def egrul_batch(request: EgrulBatchRequest):
+        return await get_owners_batch(request.bins, request.max_depth, request.max_fetches, request.timeout)
 
-    pdf_bytes = await file.read()           
-    return process_pdf(pdf_bytes)           
+    @router.get("/egrul/graph/")
+    async def egrul_graph(bin: str, budget: TraversalBudget = Depends(traversal_budget)):
+        return await get_ownership_graph(bin, budget)
 
+    @router.get("/egrul/stats/")
+    def egrul_stats():
+        return fns_stats.snapshot()
 
-@app.get("/egrul/")
-def process(bin: str):
-    return get_owners(bin)
+    return router
 
 
-@app.post("/ocr/")
-async def process(file: UploadFile = File(...)):
-    if file.content_type not in ("application/pdf", "application/x-pdf"):
-        raise HTTPException(400, "Нужен PDF-файл")
-    pdf_bytes = await file.read()           
-    return { 'result' : read_pdf(pdf_bytes)}   
+ROLE_ROUTERS = {
+    "ocr": ocr_router,
+    "extraction": extraction_router,
+    "compliance": compliance_router,
+    "egrul": egrul_router,
+}
 
 
+def create_app(roles=None) -> FastAPI:
+    """Собирает приложение из роутеров выбранных ролей (по умолчанию — из APP_ROLES)."""
+    if roles is None:
+        roles = APP_ROLES.split(",")
+    roles = [role.strip() for role in roles if role.strip()]
+    unknown = set(roles) - set(ALL_ROLES)
+    if unknown:
+        raise ValueError(f"Неизвестные роли: {', '.join(sorted(unknown))}; доступны: {', '.join(ALL_ROLES)}")
 
-@app.post("/processText/")
-async def process(request: PdfTextRequest):
-    return process_text(request.file_text)
+    tracing.setup_logging()
+    app = FastAPI()
+    # Добавленный позже middleware — внешний: трасса охватывает и подсчёт метрик
+    app.middleware("http")(limit_upload_size)
+    app.middleware("http")(count_requests)
+    app.middleware("http")(trace_requests)
+    app.include_router(service_router(roles))
+    for role in roles:
+        app.include_router(ROLE_ROUTERS[role]())
+    return app
 
-@app.post("/compliance/")
-async def process(request: PdfTextRequest):
-    return compliance_validation(request.file_text)
 
-    
+app = create_app()
@@ -0,0 +1,79 @@
+"""Метрики Prometheus для всех этапов обработки (экспортируются на /metrics)."""
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+
+# Бакеты под длинные этапы: OCR и LLM меряются секундами и минутами
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# --- HTTP ---
+REQUESTS = Counter("app_requests_total", "Запросы к API", ["endpoint", "outcome"])
+REQUEST_SECONDS = Histogram("app_request_seconds", "Время обработки запроса", ["endpoint"], buckets=SLOW_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge("app_requests_in_flight", "Запросы в обработке", ["endpoint"])
+
+# --- Контроль допуска: очереди к лимитам параллельности и отказы (503) ---
+ADMISSION_ACTIVE = Gauge("admission_active", "Занятые слоты лимита", ["limiter"])
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Запросы, ждущие слота", ["limiter"])
+ADMISSION_SHED = Counter("admission_shed_total", "Отказы из-за перегрузки", ["limiter", "reason"])
+ADMISSION_WAIT_SECONDS = Histogram(
+    "admission_wait_seconds", "Ожидание допуска к обработке", ["endpoint", "priority"], buckets=FAST_BUCKETS
+)
+
+# --- OCR и извлечение ---
+RASTERIZE_SECONDS = Histogram("ocr_rasterize_seconds", "Растеризация PDF в страницы", buckets=SLOW_BUCKETS)
+OCR_PAGE_SECONDS = Histogram("ocr_page_seconds", "OCR одной страницы", buckets=SLOW_BUCKETS)
+OCR_PAGES = Counter("ocr_pages_total", "Обработанные OCR страницы")
+OCR_PAGES_SKIPPED = Counter("ocr_pages_skipped_total", "Страницы без OCR: пустые и повторы", ["reason"])
+CLASSIFY_SECONDS = Histogram("classify_seconds", "Классификация типа договора", buckets=SLOW_BUCKETS)
+LLM_CALL_SECONDS = Histogram("llm_call_seconds", "Один вызов LLM", ["task", "rule_id"], buckets=SLOW_BUCKETS)
+LLM_CALLS_IN_FLIGHT = Gauge("llm_calls_in_flight", "Вызовы LLM в процессе", ["task"])
+LLM_HOST_IN_FLIGHT = Gauge("llm_host_in_flight", "Незавершённые запросы к хосту Ollama", ["host"])
+LLM_HOST_REQUESTS = Counter("llm_host_requests_total", "Запросы к хостам Ollama", ["host", "outcome"])
+LLM_HOST_HEALTHY = Gauge("llm_host_healthy", "Хост Ollama в ротации (1) или выведен (0)", ["host"])
+
+# --- ЕГРЮЛ ---
+EGRUL_HTTP_SECONDS = Histogram("egrul_http_seconds", "Один HTTP-запрос к ФНС", ["hop", "status"], buckets=FAST_BUCKETS)
+EGRUL_HTTP_IN_FLIGHT = Gauge("egrul_http_in_flight", "HTTP-запросы к ФНС в процессе")
+EGRUL_FETCH_QUEUE = Gauge("egrul_fetch_queue", "Загрузки выписок, ждущие слота параллельности")
+EGRUL_FETCHES_IN_FLIGHT = Gauge("egrul_fetches_in_flight", "Загрузки выписок в процессе")
+
+# --- Объединение одинаковых запросов: follower — вызов, дождавшийся чужого результата ---
+SINGLEFLIGHT_CALLS = Counter("singleflight_calls_total", "Вызовы через single-flight", ["flight", "role"])
+
+# --- Кэши: доля попаданий = hit / (hit + miss) ---
+CACHE_REQUESTS = Counter("cache_requests_total", "Обращения к кэшам", ["cache", "result"])
+
+
+def cache_hit(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class llm_call:
+    """Контекстный менеджер для замера вызова LLM: with llm_call("compliance", rule["id"]): ..."""
+
+    def __init__(self, task: str, rule_id: str = "-"):
+        self.task = task
+        self.rule_id = rule_id
+
+    def __enter__(self):
+        LLM_CALLS_IN_FLIGHT.labels(self.task).inc()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        LLM_CALLS_IN_FLIGHT.labels(self.task).dec()
+        LLM_CALL_SECONDS.labels(self.task, self.rule_id).observe(time.perf_counter() - self.started)
+
+
+def outcome(status_code: int) -> str:
+    if status_code < 400:
+        return "success"
+    if status_code in (429, 503):
+        return "rejected"
+    return "client_error" if status_code < 500 else "server_error"
+
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
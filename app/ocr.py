@@ -0,0 +1,163 @@
+"""OCR договоров: PDF → страницы → текст (Tesseract).
+
+Вынесено из processor.py, чтобы роль ocr не тянула за собой LangChain.
+
+Профиль OCR (OCR_PROFILE или параметр запроса) задаёт DPI растеризации,
+предобработку (оттенки серого, бинаризация), режим сегментации страницы
+(psm) и определение языка: по умолчанию каждая страница распознаётся
+моделями rus+eng; в профиле fast OSD определяет письменность, и страница
+распознаётся одним языком, если уверенность достаточная. Движок распознавания — ocr_backend
+(пул tesserocr или pytesseract).
+"""
+import contextvars
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from pdf2image import convert_from_path
+from PIL import Image
+
+from metrics import OCR_PAGE_SECONDS, OCR_PAGES, OCR_PAGES_SKIPPED, RASTERIZE_SECONDS
+from ocr_backend import OCR_WORKERS, backend
+from page_filter import plan_pages
+from tracing import span
+
+
+OCR_PROFILE = os.getenv("OCR_PROFILE", "balanced")
+DEFAULT_LANG = "rus+eng"
+# Минимальная уверенность OSD в письменности, чтобы распознавать страницу одним языком
+LANG_MIN_CONF = float(os.getenv("OCR_LANG_MIN_CONF", "2.0"))
+SCRIPT_LANGS = {"Cyrillic": "rus", "Latin": "eng"}
+# OSD достаточно уменьшенной страницы
+OSD_MAX_SIDE = 1200
+
+OCR_PROFILES = {
+    # Быстро: низкий DPI, один блок текста, язык по OSD
+    "fast": {"dpi": 150, "grayscale": True, "binarize": False, "psm": 6, "detect_language": True},
+    # По умолчанию: DPI как раньше, автоматическая сегментация, обе языковые модели.
+    # OSD здесь не включаем: с pytesseract это второй процесс tesseract на страницу, а на
+    # двуязычных страницах с преобладанием кириллицы rus без eng портит английские названия
+    "balanced": {"dpi": 200, "grayscale": True, "binarize": False, "psm": 3, "detect_language": False},
+    # Точно: высокий DPI, бинаризация, всегда обе языковые модели
+    "accurate": {"dpi": 300, "grayscale": True, "binarize": True, "psm": 3, "detect_language": False},
+}
+
+
+def get_profile(name: str = None) -> dict:
+    name = name or OCR_PROFILE
+    if name not in OCR_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный профиль OCR: {name}; доступны: {', '.join(OCR_PROFILES)}")
+    return {"name": name, **OCR_PROFILES[name]}
+
+
+def otsu_threshold(image) -> int:
+    """Порог бинаризации по Оцу из гистограммы яркости."""
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_back, weight_back, best, threshold = 0, 0, 0, 128
+    for i, count in enumerate(histogram):
+        weight_back += count
+        if weight_back == 0:
+            continue
+        weight_fore = total - weight_back
+        if weight_fore == 0:
+            break
+        sum_back += i * count
+        mean_back = sum_back / weight_back
+        mean_fore = (sum_all - sum_back) / weight_fore
+        between = weight_back * weight_fore * (mean_back - mean_fore) ** 2
+        if between > best:
+            best, threshold = between, i
+    return threshold
+
+
+def preprocess(image, profile: dict):
+    if profile["grayscale"] and image.mode != "L":
+        image = image.convert("L")
+    if profile["binarize"]:
+        threshold = otsu_threshold(image)
+        image = image.point(lambda p: 255 if p > threshold else 0)
+    return image
+
+
+def detect_language(image) -> str:
+    """Язык страницы по письменности из OSD; при сомнениях — rus+eng."""
+    small = image
+    if max(image.size) > OSD_MAX_SIDE:
+        small = image.copy()
+        small.thumbnail((OSD_MAX_SIDE, OSD_MAX_SIDE))
+    detected = backend.detect_script(small)
+    if detected is None:
+        return DEFAULT_LANG
+    script, confidence = detected
+    lang = SCRIPT_LANGS.get(script)
+    if lang is None or confidence < LANG_MIN_CONF:
+        return DEFAULT_LANG
+    return lang
+
+
+def ocr_page(image, profile: dict) -> str:
+    image = preprocess(image, profile)
+    lang = detect_language(image) if profile["detect_language"] else DEFAULT_LANG
+    with span("ocr.recognize", lang=lang, backend=backend.name):
+        return backend.image_to_string(image, lang, profile["psm"])
+
+
+# ЧИТАЕМ ДОГОВОР
+def read_pdf(pdf_path: str, profile: str = None, report: dict = None) -> str:
+    """Текст PDF; в report (если передан) записываются счётчики страниц: всего, распознано, пустых, повторов."""
+    profile = get_profile(profile)
+    with tempfile.TemporaryDirectory(prefix="ocr_pages_") as pages_dir:
+        # 3. Преобразуем PDF → страницы. pdftoppm пишет их файлами, и в памяти
+        # одновременно только те страницы, что сейчас распознаются.
+        try:
+            with RASTERIZE_SECONDS.time(), span("ocr.rasterize", dpi=profile["dpi"]) as attrs:
+                pages = convert_from_path(pdf_path, dpi=profile["dpi"], grayscale=profile["grayscale"],
+                                          output_folder=pages_dir, paths_only=True)
+                attrs["pages"] = len(pages)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Ошибка чтения PDF: {e}")
+
+
+        # Пустые листы не распознаём, повторы берут текст первой такой страницы
+        with span("ocr.filter") as counts:
+            plan, page_counts = plan_pages(pages)
+            counts.update(page_counts)
+        for reason in ("blank", "duplicate"):
+            OCR_PAGES_SKIPPED.labels(reason).inc(page_counts[reason])
+        if report is not None:
+            report.update(page_counts)
+        to_ocr = [i for i, (kind, _) in enumerate(plan) if kind == "ocr"]
+        recognized = dict(zip(to_ocr, recognize_pages([(i + 1, pages[i]) for i in to_ocr], profile)))
+
+        FULL_TEXT = ''
+        # Обрабатываем каждую страницу
+        for i, (kind, original) in enumerate(plan):
+            text = recognized[i] if kind == "ocr" else recognized[original] if kind == "duplicate" else ""
+            FULL_TEXT += text
+    return FULL_TEXT
+
+
+def recognize_pages(pages, profile: dict):
+    """pages — [(номер страницы, путь к картинке)]; возвращает тексты в том же порядке."""
+    if not backend.parallel or len(pages) < 2:
+        return [_recognize(number, page, profile) for number, page in pages]
+    # Движки tesserocr отпускают GIL: страницы распознаются параллельно в пуле потоков.
+    # Контекст копируем, чтобы спаны страниц попали в трассу запроса.
+    contexts = [contextvars.copy_context() for _ in pages]
+    return list(_page_executor.map(
+        lambda context, number, page: context.run(_recognize, number, page, profile),
+        contexts, *zip(*pages)))
+
+
+def _recognize(number, page_path, profile):
+    with OCR_PAGE_SECONDS.time(), span("ocr.page", page=number, profile=profile["name"]):
+        with Image.open(page_path) as page:
+            text = ocr_page(page, profile)
+    OCR_PAGES.inc()
+    return text
+
+
+_page_executor = ThreadPoolExecutor(OCR_WORKERS, thread_name_prefix="ocr") if backend.parallel else None
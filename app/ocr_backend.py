@@ -0,0 +1,147 @@
+"""Движки распознавания для ocr.py.
+
+pytesseract запускает отдельный процесс tesseract на каждую страницу: языковые
+модели грузятся заново, картинка передаётся через временные файлы.
+tesserocr держит движки в памяти процесса: пул долгоживущих экземпляров
+PyTessBaseAPI по языкам, картинка передаётся напрямую. tesserocr отпускает
+GIL на время распознавания, поэтому страницы из разных потоков идут параллельно.
+
+OCR_BACKEND: auto (tesserocr, если установлен, иначе pytesseract), tesserocr, pytesseract.
+"""
+import logging
+import os
+import threading
+
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # нужна libtesseract-dev, ставится отдельно
+    tesserocr = None
+
+
+logger = logging.getLogger(__name__)
+
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+# Сколько движков tesserocr может работать одновременно (и храниться в памяти)
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OSD_LANG = "osd"
+
+
+class PytesseractBackend:
+    """Прежний путь: процесс tesseract на каждый вызов."""
+
+    name = "pytesseract"
+    parallel = False
+
+    def image_to_string(self, image, lang: str, psm: int) -> str:
+        return pytesseract.image_to_string(image, lang=lang, config=f"--psm {psm}")
+
+    def detect_script(self, image):
+        """(письменность, уверенность) или None, если OSD не справился."""
+        try:
+            osd = pytesseract.image_to_osd(image, output_type=pytesseract.Output.DICT)
+        except pytesseract.TesseractError as e:
+            # Мало текста или нет osd.traineddata
+            logger.debug("OSD не сработал: %s", e)
+            return None
+        return osd.get("script"), float(osd.get("script_conf", 0))
+
+
+class TesserocrPool:
+    """Пул движков PyTessBaseAPI по языкам.
+
+    Одновременно заняты не больше size движков; всего в памяти тоже не больше
+    size — если для нового языка нет места, закрывается простаивающий движок
+    другого языка.
+    """
+
+    def __init__(self, size: int = OCR_WORKERS):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._idle = {}  # язык -> [движок]
+        self._total = 0
+
+    def _create(self, lang):
+        psm = tesserocr.PSM.OSD_ONLY if lang == OSD_LANG else tesserocr.PSM.AUTO
+        return tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+
+    def acquire(self, lang):
+        self._slots.acquire()
+        with self._lock:
+            idle = self._idle.get(lang)
+            if idle:
+                return idle.pop()
+            if self._total >= self.size:
+                # Место держит простаивающий движок другого языка: занятых меньше size, мы держим слот
+                other = next(engines for engines in self._idle.values() if engines)
+                other.pop().End()
+            else:
+                self._total += 1
+        logger.debug("Запускаем движок tesserocr для %s", lang)
+        try:
+            return self._create(lang)
+        except BaseException:
+            with self._lock:
+                self._total -= 1
+            self._slots.release()
+            raise
+
+    def release(self, lang, engine):
+        with self._lock:
+            self._idle.setdefault(lang, []).append(engine)
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            for engines in self._idle.values():
+                for engine in engines:
+                    engine.End()
+                    self._total -= 1
+            self._idle.clear()
+
+
+class TesserocrBackend:
+    name = "tesserocr"
+    parallel = True
+
+    def __init__(self, pool: TesserocrPool = None):
+        self.pool = pool or TesserocrPool()
+
+    def image_to_string(self, image, lang: str, psm: int) -> str:
+        engine = self.pool.acquire(lang)
+        try:
+            engine.SetPageSegMode(psm)
+            engine.SetImage(image)
+            return engine.GetUTF8Text()
+        finally:
+            engine.Clear()
+            self.pool.release(lang, engine)
+
+    def detect_script(self, image):
+        engine = self.pool.acquire(OSD_LANG)
+        try:
+            engine.SetImage(image)
+            osd = engine.DetectOrientationScript()
+        finally:
+            engine.Clear()
+            self.pool.release(OSD_LANG, engine)
+        if not osd:
+            return None
+        return osd["script_name"], float(osd["script_conf"])
+
+
+def make_backend(name: str = OCR_BACKEND):
+    if name == "pytesseract":
+        return PytesseractBackend()
+    if name == "tesserocr" or (name == "auto" and tesserocr is not None):
+        if tesserocr is None:
+            raise RuntimeError("OCR_BACKEND=tesserocr, но пакет tesserocr не установлен")
+        return TesserocrBackend()
+    if name != "auto":
+        raise ValueError(f"Неизвестный OCR_BACKEND: {name}")
+    return PytesseractBackend()
+
+
+backend = make_backend()
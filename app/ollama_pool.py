@@ -0,0 +1,180 @@
+"""Пул серверов Ollama: выбор наименее загруженного, проверка здоровья, переключение при ошибках.
+
+Хосты задаются списком в OLLAMA_HOSTS (через запятую); если он пуст,
+используется один OLLAMA_BASE_URL. Запрос уходит на исправный хост с
+наименьшим числом незавершённых запросов. При сетевой ошибке или 5xx хост
+выводится из ротации на OLLAMA_HOST_COOLDOWN секунд, а запрос повторяется
+на следующем. По истечении паузы хост сначала проверяется запросом
+/api/tags и только потом снова получает работу. К каждому хосту —
+свой httpx.Client, соединения переиспользуются между запросами.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+import httpx
+
+from metrics import LLM_HOST_HEALTHY, LLM_HOST_IN_FLIGHT, LLM_HOST_REQUESTS
+
+
+logger = logging.getLogger(__name__)
+
+# --- Настройки (через переменные окружения) ---
+OLLAMA_HOSTS = os.getenv("OLLAMA_HOSTS") or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+REQUEST_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "600"))       # генерация большой модели идёт минутами
+CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+HEALTH_TIMEOUT = float(os.getenv("OLLAMA_HEALTH_TIMEOUT", "2"))
+HOST_COOLDOWN = float(os.getenv("OLLAMA_HOST_COOLDOWN", "10"))
+MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))   # на один хост
+
+
+class OllamaUnavailable(Exception):
+    """Ни один хост Ollama не смог ответить."""
+
+
+class OllamaHost:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.client = httpx.Client(
+            base_url=self.url,
+            timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+        )
+        self.outstanding = 0
+        self.served = 0
+        self.last_pick = 0
+        self.healthy = True
+        self.retry_at = 0.0
+        self.probing = False
+        self.last_error = None
+        LLM_HOST_HEALTHY.labels(self.url).set(1)
+
+    def snapshot(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "served": self.served,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaPool:
+    def __init__(self, urls: List[str], cooldown: float = HOST_COOLDOWN):
+        if not urls:
+            raise ValueError("Не задано ни одного хоста Ollama")
+        self.hosts = [OllamaHost(url) for url in urls]
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._picks = itertools.count(1)
+
+    @classmethod
+    def from_env(cls) -> "OllamaPool":
+        return cls([url.strip() for url in OLLAMA_HOSTS.split(",") if url.strip()])
+
+    def _mark_down(self, host: OllamaHost, error: str):
+        with self._lock:
+            host.healthy = False
+            host.retry_at = time.monotonic() + self.cooldown
+            host.last_error = error
+        LLM_HOST_HEALTHY.labels(host.url).set(0)
+        logger.warning("Ollama %s выведен из ротации на %.0f с: %s", host.url, self.cooldown, error)
+
+    def check(self, host: OllamaHost) -> bool:
+        """Проверка здоровья: хост отвечает на /api/tags."""
+        try:
+            response = host.client.get("/api/tags", timeout=HEALTH_TIMEOUT)
+            ok = response.status_code == 200
+            error = None if ok else f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            ok, error = False, repr(e)
+        with self._lock:
+            host.probing = False
+            host.healthy = ok
+            host.last_error = error
+            if not ok:
+                host.retry_at = time.monotonic() + self.cooldown
+        LLM_HOST_HEALTHY.labels(host.url).set(1 if ok else 0)
+        if ok:
+            logger.info("Ollama %s снова в ротации", host.url)
+        return ok
+
+    def _recover(self):
+        # Хосты, у которых истекла пауза, проверяются до того, как снова получат запрос
+        with self._lock:
+            now = time.monotonic()
+            due = [host for host in self.hosts if not host.healthy and not host.probing and host.retry_at <= now]
+            for host in due:
+                host.probing = True
+        for host in due:
+            self.check(host)
+
+    def acquire(self, exclude=()) -> Optional[OllamaHost]:
+        """Хост с наименьшим числом незавершённых запросов (при равенстве — дольше не выбиравшийся)."""
+        self._recover()
+        with self._lock:
+            candidates = [host for host in self.hosts if host.healthy and host not in exclude]
+            if not candidates:
+                # Все исправные уже пробовали или их нет: последний шанс — ещё не опрошенные хосты
+                candidates = [host for host in self.hosts if host not in exclude]
+            if not candidates:
+                return None
+            host = min(candidates, key=lambda h: (h.outstanding, h.last_pick))
+            host.outstanding += 1
+            host.served += 1
+            host.last_pick = next(self._picks)
+        LLM_HOST_IN_FLIGHT.labels(host.url).inc()
+        return host
+
+    def release(self, host: OllamaHost):
+        with self._lock:
+            host.outstanding -= 1
+        LLM_HOST_IN_FLIGHT.labels(host.url).dec()
+
+    def generate(self, model: str, prompt: str, options: Optional[dict] = None, stop: Optional[List[str]] = None) -> str:
+        """POST /api/generate без стриминга; при отказе хоста — повтор на другом."""
+        payload = {"model": model, "prompt": prompt, "stream": False, "options": dict(options or {})}
+        if stop:
+            payload["options"]["stop"] = stop
+        tried, errors = [], []
+        while True:
+            host = self.acquire(exclude=tried)
+            if host is None:
+                raise OllamaUnavailable(f"Ollama недоступна: {'; '.join(errors) or 'нет хостов'}")
+            tried.append(host)
+            try:
+                response = host.client.post("/api/generate", json=payload)
+            except httpx.TransportError as e:
+                error = f"{host.url}: {e!r}"
+            else:
+                if response.status_code < 500:
+                    # 4xx (нет модели, плохой запрос) на другом хосте не исправится
+                    LLM_HOST_REQUESTS.labels(host.url, "success" if response.is_success else "client_error").inc()
+                    response.raise_for_status()
+                    return response.json()["response"]
+                error = f"{host.url}: HTTP {response.status_code} {response.text[:200]}"
+            finally:
+                self.release(host)
+            LLM_HOST_REQUESTS.labels(host.url, "failover").inc()
+            errors.append(error)
+            self._mark_down(host, error)
+
+    def snapshot(self) -> list:
+        with self._lock:
+            return [host.snapshot() for host in self.hosts]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> OllamaPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = OllamaPool.from_env()
+    return _pool
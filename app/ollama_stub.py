@@ -0,0 +1,82 @@
+"""Локальная заглушка сервера Ollama для проверки пула хостов (ollama_pool.py).
+
+Отвечает на /api/tags и /api/generate (без стриминга) детерминированными
+ответами llm_backend.fake_answer. Задержка и доля ошибок 5xx
+настраиваются; запуская несколько заглушек на разных портах, можно
+проверить распределение нагрузки и переключение при отказе хоста.
+
+    STUB_OLLAMA_LATENCY_MS=500 uvicorn ollama_stub:app --port 11501
+    STUB_OLLAMA_LATENCY_MS=500 uvicorn ollama_stub:app --port 11502
+    OLLAMA_HOSTS=http://localhost:11501,http://localhost:11502 uvicorn main:app
+"""
+import asyncio
+import os
+import random
+import threading
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from llm_backend import fake_answer
+
+
+class StubConfig:
+    def __init__(self, **overrides):
+        self.latency_ms = float(os.getenv("STUB_OLLAMA_LATENCY_MS", "200"))  # время «генерации»
+        self.error_rate = float(os.getenv("STUB_OLLAMA_ERROR_RATE", "0"))    # доля случайных 500
+        self.down = os.getenv("STUB_OLLAMA_DOWN", "0") == "1"                # отвечать 503 на всё
+        for name, value in overrides.items():
+            setattr(self, name, value)
+
+
+config = StubConfig()
+app = FastAPI(title="Ollama stub")
+
+_lock = threading.Lock()
+_counters = {"generate": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def configure(**overrides):
+    """Перенастраивает заглушку (например, «роняет» хост посреди теста: configure(down=True))."""
+    global config
+    config = StubConfig(**overrides)
+
+
+class GenerateRequest(BaseModel):
+    model: str
+    prompt: str
+    stream: bool = False
+    options: dict = {}
+
+
+@app.get("/api/tags")
+async def tags():
+    if config.down:
+        raise HTTPException(503, "down")
+    return {"models": []}
+
+
+@app.post("/api/generate")
+async def generate(request: GenerateRequest):
+    if config.down:
+        raise HTTPException(503, "down")
+    with _lock:
+        _counters["generate"] += 1
+        _counters["in_flight"] += 1
+        _counters["max_in_flight"] = max(_counters["max_in_flight"], _counters["in_flight"])
+    try:
+        await asyncio.sleep(config.latency_ms / 1000)
+        if random.random() < config.error_rate:
+            with _lock:
+                _counters["errors"] += 1
+            raise HTTPException(500, "stub error")
+        return {"model": request.model, "response": fake_answer(request.prompt), "done": True}
+    finally:
+        with _lock:
+            _counters["in_flight"] -= 1
+
+
+@app.get("/stub/stats")
+async def stub_stats():
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,223 @@
+"""Отсев страниц перед OCR: пустые листы-разделители и повторы.
+
+Пустая страница — та, где без полей нет ни одной строки текста: строкой
+считается ряд пикселей, в котором тёмных заметная доля, а не случайные
+точки шума. Так одна строка заголовка приложения или подпись страницу
+не «теряют», хотя общая доля чернил на ней мизерная.
+Повтор — страница, совпадающая с одной из предыдущих: побайтно одинаковые
+растры находятся по хэшу; остальные кандидаты отбираются по перцептивным
+хэшам (dHash 16×16) и уменьшенным копиям, а подтверждаются сравнением в
+полном разрешении: страницы выравниваются по перекосу и сдвигу (повторный
+скан того же листа ложится иначе) и сравниваются по клеткам размером с
+символ — страницы, различающиеся одной цифрой суммы, повтором не считаются.
+Пустые страницы не распознаются, повторы берут текст оригинала.
+"""
+import bisect
+import hashlib
+import itertools
+import math
+import os
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image, ImageChops, ImageFilter
+
+
+SKIP_BLANK = os.getenv("OCR_SKIP_BLANK", "1") == "1"
+SKIP_DUPLICATES = os.getenv("OCR_SKIP_DUPLICATES", "1") == "1"
+# Страница пустая, если рядов пикселей с текстом меньше этого (строка 11 pt при 150–300 dpi — 15–40 рядов)
+BLANK_MIN_ROWS = int(os.getenv("OCR_BLANK_MIN_ROWS", "4"))
+# Доля тёмных пикселей в ряду, с которой ряд считается текстом (шум скана — около 0.05%)
+BLANK_ROW_INK = float(os.getenv("OCR_BLANK_ROW_INK", "0.005"))
+# Порог расстояния Хэмминга между 256-битными хэшами (у разных страниц договора — от ~40)
+DUPLICATE_MAX_DISTANCE = int(os.getenv("OCR_DUPLICATE_MAX_DISTANCE", "12"))
+# Порог средней разницы яркости уменьшенных копий (у разных страниц — от ~5)
+DUPLICATE_MAX_DIFF = float(os.getenv("OCR_DUPLICATE_MAX_DIFF", "2.5"))
+# Наибольшее расхождение клетки у повтора (у повторных сканов — до ~25, изменённая цифра — от ~40)
+DUPLICATE_MAX_TILE_DIFF = float(os.getenv("OCR_DUPLICATE_MAX_TILE_DIFF", "32"))
+# Какой перекос (градусы) и сдвиг (доля размера страницы) между сканами выравнивается
+DUPLICATE_MAX_SKEW = float(os.getenv("OCR_DUPLICATE_MAX_SKEW", "2"))
+DUPLICATE_MAX_SHIFT = float(os.getenv("OCR_DUPLICATE_MAX_SHIFT", "0.02"))
+
+INK_LEVEL = 128      # пиксель темнее — «чернила»
+TILE = 32            # клетка сравнения — примерно символ при 200–300 dpi
+LOCAL_SHIFT = 2      # на сколько пикселей клетка может сдвинуться после общего совмещения
+ALIGN_BLUR = 2       # размытие перед сравнением: полпикселя расхождения штриха — не изменение
+MARGIN = 0.03        # поля, где бывают тени от краёв скана
+THUMB_SIZE = (64, 90)
+HASH_SIZE = 16
+
+
+def crop_margins(image):
+    width, height = image.size
+    dx, dy = int(width * MARGIN), int(height * MARGIN)
+    return image.crop((dx, dy, width - dx, height - dy))
+
+
+def text_rows(image) -> int:
+    """Число рядов пикселей, где доля тёмных не меньше BLANK_ROW_INK."""
+    ink = image.point(lambda level: 255 if level < INK_LEVEL else 0)
+    # Сжатие до ширины 1 с усреднением даёт долю тёмных пикселей в каждом ряду
+    profile = ink.resize((1, image.height), Image.BOX).tobytes()
+    return sum(1 for value in profile if value >= BLANK_ROW_INK * 255)
+
+
+def dhash(thumb) -> int:
+    small = thumb.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for y in range(HASH_SIZE):
+        row = pixels[y * (HASH_SIZE + 1):(y + 1) * (HASH_SIZE + 1)]
+        for x in range(HASH_SIZE):
+            value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+
+def mean_difference(a, b) -> float:
+    histogram = ImageChops.difference(a, b).histogram()
+    return sum(level * count for level, count in enumerate(histogram)) / max(1, sum(histogram))
+
+
+def page_signature(path: str):
+    """(рядов с текстом, хэш растра, dHash, уменьшенная копия) страницы."""
+    with Image.open(path) as image:
+        gray = image.convert("L")
+        content_hash = hashlib.sha256(gray.tobytes()).hexdigest()
+        page = crop_margins(gray)
+        thumb = page.resize(THUMB_SIZE, Image.BILINEAR)
+        return text_rows(page), content_hash, dhash(thumb), thumb
+
+
+def ink_map(image):
+    """Чернила светлым по тёмному, 0 — бумага, 255 — самые тёмные штрихи.
+
+    Яркость нормируется по самой странице (фон — медиана, чернила — 1-й
+    перцентиль), поэтому повторный скан с другой экспозицией даёт ту же карту;
+    медианный фильтр убирает одиночные точки шума.
+    """
+    gray = image.convert("L").filter(ImageFilter.MedianFilter(3))
+    levels = list(itertools.accumulate(gray.histogram()))
+    paper = bisect.bisect_left(levels, levels[-1] * 0.5)
+    ink = bisect.bisect_left(levels, levels[-1] * 0.01)
+    span = max(1, paper - ink)
+    return gray.point(lambda level: max(0, min(255, (paper - level) * 255 // span)))
+
+
+def skew_angle(ink) -> float:
+    """Перекос страницы в градусах (как у Image.rotate): выравнивает её rotate(-angle).
+
+    Ищется угол, при котором проекция чернил на вертикаль самая контрастная —
+    строки не смазаны друг на друга: грубо по копии в половинном разрешении,
+    затем точно в полном.
+    """
+    def sharpness(pixels, angle):
+        ys, xs, weights = pixels
+        t = math.radians(angle)
+        y = ys * math.cos(t) + xs * math.sin(t)
+        y -= y.min()
+        # Вес пикселя делится между соседними рядами: без этого выигрывает угол 0, где ряды совпадают с сеткой
+        row = np.floor(y).astype(np.int64)
+        part = y - row
+        size = row.max() + 2
+        profile = (np.bincount(row, weights * (1 - part), size)
+                   + np.bincount(row + 1, weights * part, size))
+        return float(np.dot(profile, profile))
+
+    def best(image, angles):
+        values = np.asarray(image, dtype=np.float64)
+        ys, xs = np.nonzero(values > 64)
+        pixels = (ys, xs, values[ys, xs])
+        if not len(ys):
+            return 0.0
+        return float(max(angles, key=lambda angle: sharpness(pixels, angle)))
+
+    half = ink.resize((max(1, ink.width // 2), max(1, ink.height // 2)), Image.BOX)
+    coarse = best(half, np.arange(-DUPLICATE_MAX_SKEW, DUPLICATE_MAX_SKEW + 1e-9, 0.1))
+    return best(ink, np.arange(coarse - 0.1, coarse + 0.1 + 1e-9, 0.01))
+
+
+def aligned_ink(image):
+    """Карта чернил выровненной по перекосу страницы, размытая на доли штриха."""
+    ink = ink_map(image)
+    ink = ink.rotate(-skew_angle(ink), Image.BILINEAR).filter(ImageFilter.GaussianBlur(ALIGN_BLUR))
+    return np.asarray(ink, dtype=np.float32) / 255
+
+
+def best_shift(profile, other, limit: int) -> int:
+    """Сдвиг d, при котором other[i + d] лучше всего совпадает с profile[i]."""
+    profile, other = profile - profile.mean(), other - other.mean()
+    n = len(profile)
+    scores = [np.dot(profile[max(0, -d):n - max(0, d)], other[max(0, d):n - max(0, -d)])
+              for d in range(-limit, limit + 1)]
+    return int(np.argmax(scores)) - limit
+
+
+def tile_difference(ink, other) -> float:
+    """Наибольшее расхождение двух выровненных страниц по клеткам TILE×TILE.
+
+    Страницы совмещаются сдвигом по профилям строк и столбцов; каждая клетка
+    дополнительно ищет свой сдвиг в пределах LOCAL_SHIFT пикселей — так
+    гасится неточность выравнивания по краям листа. Перекос и сдвиг дают
+    расхождение, размазанное по всей странице; изменённый символ — пятно в
+    одной клетке.
+    """
+    limit = int(max(ink.shape) * DUPLICATE_MAX_SHIFT)
+    dy = best_shift(ink.sum(axis=1), other.sum(axis=1), limit)
+    dx = best_shift(ink.sum(axis=0), other.sum(axis=0), limit)
+    other = np.roll(other, (-dy, -dx), axis=(0, 1))
+    m = LOCAL_SHIFT
+    rows, columns = (ink.shape[0] - 2 * m) // TILE, (ink.shape[1] - 2 * m) // TILE
+    height, width = rows * TILE, columns * TILE
+    core = ink[m:m + height, m:m + width]
+    best = np.full((rows, columns), np.inf)
+    for sy in range(-m, m + 1):
+        for sx in range(-m, m + 1):
+            difference = np.abs(core - other[m + sy:m + sy + height, m + sx:m + sx + width])
+            best = np.minimum(best, difference.reshape(rows, TILE, columns, TILE).sum(axis=(1, 3)))
+    # Поля не сравниваем: там тени краёв скана и то, что вышло за край при повороте
+    my, mx = int(rows * MARGIN) + 1, int(columns * MARGIN) + 1
+    return float(best[my:rows - my, mx:columns - mx].max(initial=0.0))
+
+
+def same_page(path: str, other_path: str) -> bool:
+    """Подтверждение повтора в полном разрешении с учётом перекоса, сдвига и экспозиции повторного скана."""
+    with Image.open(path) as image, Image.open(other_path) as other:
+        if image.size != other.size:
+            return False
+        return tile_difference(aligned_ink(image), aligned_ink(other)) <= DUPLICATE_MAX_TILE_DIFF
+
+
+def plan_pages(page_paths: List[str]) -> Tuple[list, dict]:
+    """План на каждую страницу: ("ocr", None), ("blank", None) или ("duplicate", индекс оригинала).
+
+    Возвращает план и счётчики страниц по видам.
+    """
+    plan, unique = [], []  # unique: (индекс, хэш растра, dHash, копия) распознаваемых страниц
+    counts = {"total": len(page_paths), "ocr": 0, "blank": 0, "duplicate": 0}
+    for index, path in enumerate(page_paths):
+        if not (SKIP_BLANK or SKIP_DUPLICATES):
+            plan.append(("ocr", None))
+            counts["ocr"] += 1
+            continue
+        rows, content_hash, page_hash, thumb = page_signature(path)
+        if SKIP_BLANK and rows < BLANK_MIN_ROWS:
+            plan.append(("blank", None))
+            counts["blank"] += 1
+            continue
+        original = None
+        if SKIP_DUPLICATES:
+            for other, other_content, other_hash, other_thumb in unique:
+                if content_hash == other_content or (
+                        bin(page_hash ^ other_hash).count("1") <= DUPLICATE_MAX_DISTANCE
+                        and mean_difference(thumb, other_thumb) <= DUPLICATE_MAX_DIFF
+                        and same_page(path, page_paths[other])):
+                    original = other
+                    break
+        if original is not None:
+            plan.append(("duplicate", original))
+            counts["duplicate"] += 1
+        else:
+            plan.append(("ocr", None))
+            counts["ocr"] += 1
+            unique.append((index, content_hash, page_hash, thumb))
+    return plan, counts
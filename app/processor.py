@@ -1,24 +1,22 @@
 
-from pdf2image import convert_from_path
-from pdf2image import convert_from_bytes 
-import pytesseract
 from langchain.prompts import PromptTemplate 
-from langchain_community.llms import Ollama
+from llm_backend import make_llm
+from metrics import llm_call
+from ocr import read_pdf
+from tracing import span
 from langchain.chains import LLMChain
 import json
-from fastapi import FastAPI, UploadFile, File, HTTPException
-import os
 
-def process_pdf(pdf_bytes: bytes) -> dict:
-    full_text = read_pdf(pdf_bytes)
+def process_pdf(pdf_path: str, ocr_profile: str = None) -> dict:
+    full_text = read_pdf(pdf_path, ocr_profile)
     return process_text(full_text)
 
 def process_text(file_text: str) -> dict:
     prompt = get_prompt()
-    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-    llm = Ollama(model="llama3:70b-instruct-q2_K", base_url=base_url, num_ctx=8192)
+    llm = make_llm(num_ctx=8192)
     llm_chain = LLMChain(llm=llm, prompt=prompt)
-    answer = llm_chain.run(document=file_text)
+    with llm_call("extraction"), span("llm.extraction", chars=len(file_text)):
+        answer = llm_chain.run(document=file_text)
     cleaned_answer = remove_extra_text(answer)
     # Пытаемся распарсить JSON
     try:
@@ -36,27 +34,6 @@ def process_text(file_text: str) -> dict:
     }
 
 
-# ЧИТАЕМ ДОГОВОР
-def read_pdf(pdf_bytes: bytes) -> str:
-    # 3. Преобразуем PDF → PIL-страницы
-    try:
-        pages = convert_from_bytes(pdf_bytes)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка чтения PDF: {e}")
-
-
-    FULL_TEXT = ''
-    # Обрабатываем каждую страницу
-    for i, page in enumerate(pages):
-        text = pytesseract.image_to_string(page, lang='rus+eng')  # если нужен русский и английский
-        #print(f'--- Страница {i+1} ---\n{text}\n')
-        # Можно сохранить текст в файл
-        with open(f'page_{i+1}.txt', 'w', encoding='utf-8') as f:
-            f.write(text)
-        FULL_TEXT += text
-    return FULL_TEXT
-
-
 def get_prompt() -> PromptTemplate:
     #СОЗДАЕМ PROMPT
     TEMPLATE = TEMPLATE = """
@@ -0,0 +1,84 @@
+"""Реестр правил валютного контроля из файла (rules.json).
+
+Файл перечитывается, когда меняется его mtime, — правила можно править без
+перезапуска. У каждого правила есть version (задаётся вручную) и hash от
+текста правила и промпта проверки: кэш вердиктов привязан к ним, поэтому
+правка одного правила сбрасывает только его вердикты.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = os.getenv("COMPLIANCE_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json"))
+REQUIRED_FIELDS = ("id", "version", "rule", "applies_to")
+
+
+class RuleRegistryError(Exception):
+    """Файл правил не читается или содержит ошибки."""
+
+
+class RuleRegistry:
+    def __init__(self, path: str = RULES_PATH, prompt: str = "", resolve_type=None):
+        self.path = path
+        self.prompt = prompt                      # текст промпта входит в hash правила
+        self.resolve_type = resolve_type or (lambda name: name)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._rules = []
+
+    def rules(self) -> list:
+        """Актуальные правила; при изменении файла перечитывает его."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if not self._rules:
+                raise RuleRegistryError(f"Нет файла правил {self.path}: {e}") from e
+            logger.error("Файл правил %s недоступен, работаем со старыми правилами: %s", self.path, e)
+            return self._rules
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self._reload(mtime)
+        return self._rules
+
+    def get(self, rule_id: str):
+        return next((rule for rule in self.rules() if rule["id"] == rule_id), None)
+
+    def _reload(self, mtime):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                rules = [self._prepare(raw) for raw in json.load(f)]
+            ids = [rule["id"] for rule in rules]
+            duplicates = sorted({rule_id for rule_id in ids if ids.count(rule_id) > 1})
+            if duplicates:
+                raise RuleRegistryError(f"Повторяются id правил: {', '.join(duplicates)}")
+        except (OSError, ValueError, KeyError, RuleRegistryError) as e:
+            if not self._rules:
+                raise RuleRegistryError(f"Ошибка в файле правил {self.path}: {e}") from e
+            # Битый файл не должен ронять проверки: остаёмся на прошлой версии до следующей правки
+            logger.error("Ошибка в файле правил %s, работаем со старыми правилами: %s", self.path, e)
+            self._mtime = mtime
+            return
+        self._rules = rules
+        self._mtime = mtime
+        logger.info("Загружено правил: %d из %s", len(rules), self.path)
+
+    def _prepare(self, raw: dict) -> dict:
+        missing = [field for field in REQUIRED_FIELDS if field not in raw]
+        if missing:
+            raise RuleRegistryError(f"У правила {raw.get('id', '?')} нет полей: {', '.join(missing)}")
+        digest = hashlib.sha256(
+            json.dumps([self.prompt, raw["id"], raw["rule"]], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:16]
+        return {
+            **raw,
+            "applies_to": [self.resolve_type(name) for name in raw["applies_to"]],
+            "keywords": [keyword.lower() for keyword in raw.get("keywords", [])],
+            "references": raw.get("references", []),
+            "hash": digest,
+        }
@@ -0,0 +1,66 @@
+"""Объединение одинаковых одновременных запросов (single-flight).
+
+Если работа с тем же ключом (хэш содержимого, ИНН) уже выполняется, новый
+вызов не запускает её заново, а ждёт готового результата или ошибки первого.
+Общая работа идёт отдельной задачей: отключение первого клиента не обрывает
+её для остальных. Запись о работе удаляется сразу после завершения, поэтому
+это не кэш — результаты не хранятся.
+"""
+import asyncio
+import hashlib
+
+from metrics import SINGLEFLIGHT_CALLS
+from tracing import span
+
+
+def content_key(*parts) -> str:
+    """Ключ из содержимого: sha256 по частям (строки, байты, None)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+    def __contains__(self, key) -> bool:
+        return key in self._calls
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Ошибку заберут ожидающие; если их не осталось, не шумим в лог «never retrieved»
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, fn, retry_on=(), timeout=None):
+        """Результат корутины fn(), общий для всех одновременных вызовов с этим ключом.
+
+        fn вызывается синхронно, до первого await, — только у первого вызова
+        (и у тех, кто повторяет работу сам).
+
+        Ошибки из retry_on относятся к первому вызову (например, его бюджет
+        исчерпан), а не к самой работе: получив такую, остальные выполняют fn сами.
+        timeout ограничивает ожидание этого вызова (asyncio.TimeoutError), сама работа продолжается.
+        """
+        task = self._calls.get(key)
+        if task is not None and task.get_loop() is not asyncio.get_running_loop():
+            # Работа идёт в другом цикле событий (другой поток) — её не дождаться, выполняем сами
+            return await asyncio.wait_for(fn(), timeout)
+        if task is None:
+            SINGLEFLIGHT_CALLS.labels(self.name, "leader").inc()
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        SINGLEFLIGHT_CALLS.labels(self.name, "follower").inc()
+        with span("singleflight.wait", flight=self.name):
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), timeout)
+            except retry_on:
+                return await asyncio.wait_for(fn(), timeout)
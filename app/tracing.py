@@ -0,0 +1,162 @@
+"""Трассировка запросов и структурированные логи.
+
+Каждый HTTP-запрос получает request_id (из заголовка X-Request-ID или новый)
+и трассу — список спанов с началом, длительностью и атрибутами. Этапы
+оборачиваются в `with span("ocr.page", page=3): ...`; вне запроса span
+ничего не делает. Последние трассы хранятся в памяти и отдаются как JSON.
+"""
+import contextvars
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text или json
+TRACE_STORE_SIZE = int(os.getenv("TRACE_STORE_SIZE", "200"))
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+class Trace:
+    def __init__(self, request_id: str, name: str):
+        self.request_id = request_id
+        self.name = name
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.status = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def offset_ms(self, moment: float) -> float:
+        return round((moment - self._started) * 1000, 3)
+
+    def add(self, span: dict):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self, status=None):
+        self.duration_ms = self.offset_ms(time.perf_counter())
+        self.status = status
+
+    def summary(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "spans": len(self.spans),
+        }
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {**self.summary(), "spans": spans}
+
+
+class TraceStore:
+    """Последние трассы в памяти (LRU)."""
+
+    def __init__(self, max_traces: int = TRACE_STORE_SIZE):
+        self.max_traces = max_traces
+        self._traces: "OrderedDict[str, Trace]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces[trace.request_id] = trace
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, request_id: str) -> Optional[Trace]:
+        with self._lock:
+            return self._traces.get(request_id)
+
+    def recent(self, limit: int = 50):
+        with self._lock:
+            traces = list(self._traces.values())[-limit:]
+        return [trace.summary() for trace in reversed(traces)]
+
+
+trace_store = TraceStore()
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+@contextmanager
+def start_trace(name: str, request_id: str = None):
+    trace = Trace(request_id or uuid.uuid4().hex, name)
+    token = _current_trace.set(trace)
+    trace_store.add(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    trace = _current_trace.get()
+    if trace is None:
+        yield attrs
+        return
+    span_id = next(_span_ids)
+    parent = _current_span.get()
+    token = _current_span.set(span_id)
+    started = time.perf_counter()
+    error = None
+    try:
+        # Вызывающий код может дописать атрибуты по ходу: with span(...) as attrs: attrs["pages"] = 3
+        yield attrs
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        finished = time.perf_counter()
+        record = {
+            "id": span_id,
+            "parent_id": parent,
+            "name": name,
+            "start_ms": trace.offset_ms(started),
+            "duration_ms": round((finished - started) * 1000, 3),
+            "thread": threading.current_thread().name,
+            "attrs": attrs,
+        }
+        if error:
+            record["error"] = error
+        trace.add(record)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = current_request_id() or "-"
+        return True
+
+
+def setup_logging():
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
+    if LOG_FORMAT == "json":
+        from pythonjsonlogger.json import JsonFormatter
+        handler.setFormatter(JsonFormatter("%(asctime)s %(levelname)s %(name)s %(request_id)s %(message)s"))
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+    # httpx пишет каждый запрос к ФНС на INFO — это уже видно в трассе
+    logging.getLogger("httpx").setLevel(max(logging.WARNING, root.level))
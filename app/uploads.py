@@ -0,0 +1,74 @@
+"""Приём загружаемых PDF: на диск по частям, с ограничением размера.
+
+Starlette сам держит в памяти не больше 1 МБ загрузки (дальше — временный
+файл), поэтому файл копируется на диск блоками и дальше обрабатывается по
+пути: в памяти процесса не оказывается целая копия документа.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None  # None — системный каталог временных файлов
+CHUNK_SIZE = 1024 * 1024
+
+
+def too_large() -> HTTPException:
+    return HTTPException(413, f"Файл больше {MAX_UPLOAD_BYTES // (1024 * 1024)} МБ")
+
+
+async def limit_upload_size(request, call_next):
+    # Отказываем по Content-Length до разбора multipart, чтобы не принимать лишнее
+    length = request.headers.get("content-length")
+    if request.method == "POST" and length and length.isdigit() and int(length) > MAX_UPLOAD_BYTES:
+        error = too_large()
+        return JSONResponse({"detail": error.detail}, status_code=error.status_code)
+    return await call_next(request)
+
+
+@asynccontextmanager
+async def spooled_upload(file: UploadFile):
+    """Копирует загрузку во временный файл и отдаёт путь; файл удаляется на выходе."""
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_DIR)
+    try:
+        size = 0
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await file.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise too_large()
+                out.write(chunk)
+        yield path
+    finally:
+        os.remove(path)
+
+
+def file_digest(path: str) -> str:
+    """sha256 файла, читаемого блоками (ключ для объединения одинаковых загрузок)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_upload(path: str) -> str:
+    """Вторая ссылка на загруженный файл (или копия, если ФС не умеет ссылки); удаляет вызывающий.
+
+    Нужна общей работе single-flight: временный файл первого клиента удаляется,
+    как только тот отключится, а остальные ещё ждут результата.
+    """
+    fd, own_path = tempfile.mkstemp(suffix=".pdf", dir=os.path.dirname(path))
+    os.close(fd)
+    os.remove(own_path)
+    try:
+        os.link(path, own_path)
+    except OSError:
+        shutil.copyfile(path, own_path)
+    return own_path